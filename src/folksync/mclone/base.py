@@ -19,15 +19,24 @@ class DataSource:
         raise NotImplementedError()
 
     def get(self, key):
+        """Fetch a single item; returns None if the key is missing."""
         raise NotImplementedError()
 
 
 class DataSink(DataSource):
+    #: Optional mapping.AttributeMapping, providing a compiled merge()
+    attribute_mapping = None
 
     def get_skipped_keys(self, source_keys):
         return set()
 
+    def get_skip_rules(self):
+        """Return declarative SkipRules, or None; applied on top of get_skipped_keys()."""
+        return None
+
     def merge(self, base, updated):
+        if self.attribute_mapping is not None:
+            return self.attribute_mapping.merge(base, updated)
         raise NotImplementedError()
 
     def create_batch(self, changes):
@@ -38,3 +47,20 @@ class DataSink(DataSource):
 
     def delete_batch(self, changes):
         raise NotImplementedError()
+
+
+class MultiDataSink(DataSource):
+    """A sink made of several related collections, e.g. users, groups and memberships.
+
+    Each collection is handled by its own DataSink; a collection is only
+    created/updated once all collections it depends on have been, and
+    deleted before them.
+    """
+
+    def collections(self):
+        """Return an ordered {name => DataSink} mapping."""
+        raise NotImplementedError()
+
+    def dependencies(self):
+        """Return a {name => names} mapping of the collections each collection relies on."""
+        return {}
@@ -29,6 +29,7 @@ class ReplicationStepState(enum.Enum):
     SKIPPED = 1
     START = 2
     SUCCESS = 3
+    PARTIAL = 4
 
 
 #: Change: an atomic change.
@@ -53,7 +54,53 @@ Change = collections.namedtuple(
 #:  - keys (text set): all item keys
 #:  - changes ((DataSink, {Action: {key: Change}}) list): list of changes per sink
 #:  - stats ({Action: max_affected}): maps an action to the total number of items
+#:  - divergences ({DataSink: {Action: {key: Change}}}): follow-up changes
+#:      found when re-reading applied items; empty unless a verifier is set
+#:  - failures ({DataSink: {Action: {key: Exception}}}): changes rejected by their sink
 ReplicationContext = collections.namedtuple(
     'ReplicationContext',
-    ['source', 'sinks', 'keys', 'changes', 'stats'],
+    ['source', 'sinks', 'keys', 'changes', 'stats', 'divergences', 'failures'],
+)
+
+
+#: SourceSnapshot: the source items for a run, fetched once.
+#: Attributes:
+#:  - data ({key: item}): all source items
+#:  - keys (frozenset): the source keys, computed once for all sinks
+SourceSnapshot = collections.namedtuple(
+    'SourceSnapshot',
+    ['data', 'keys'],
+)
+
+
+#: Tenant: a group of sinks replicated together, with its own interactor and decider.
+#: Attributes:
+#:  - name (text): the tenant name
+#:  - sinks (DataSink list): the tenant's sinks
+#:  - interactor (BaseInteractor): the tenant's interactor
+Tenant = collections.namedtuple(
+    'Tenant',
+    ['name', 'sinks', 'interactor'],
+)
+
+
+#: Step: all changes of a given action for a sink.
+#: Attributes:
+#:  - sink (DataSink): the target sink
+#:  - action (Action): the action to perform
+#:  - handler (callable): the sink method applying a {key: Change} dict
+#:  - changes ({key: Change}): the changes to apply
+Step = collections.namedtuple(
+    'Step',
+    ['sink', 'action', 'handler', 'changes'],
+)
+
+
+#: Batch: a subset of a Step's changes, sharing the same priority.
+#: Attributes:
+#:  - priority (int): lower values are applied first
+#:  - sink, action, handler, changes: as for Step
+Batch = collections.namedtuple(
+    'Batch',
+    ['priority', 'sink', 'action', 'handler', 'changes'],
 )
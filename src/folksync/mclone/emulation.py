@@ -0,0 +1,229 @@
+"""Local emulations of remote directory services, for load testing.
+
+An EmulatedService keeps its items in memory, and behaves like a remote
+API: per-request latency, paginated listing, bounded batch sizes, rate
+limiting and injected errors. EmulatedSource and EmulatedSink are the
+matching DataSource/DataSink clients.
+"""
+
+import collections
+import random
+import threading
+import time
+
+from .base import DataSink, DataSource
+
+
+class EmulationError(Exception):
+    pass
+
+
+class TransientError(EmulationError):
+    """A random server-side failure; the request may be retried."""
+
+
+class RateLimited(TransientError):
+    def __init__(self, retry_after):
+        super().__init__("Rate limited, retry after %.3fs" % retry_after)
+        self.retry_after = retry_after
+
+
+class RejectedItems(EmulationError):
+    """Permanent failure: the request contained invalid items."""
+
+    def __init__(self, keys):
+        super().__init__("Rejected items: %s" % ', '.join(sorted(keys)))
+        self.keys = keys
+
+
+class EmulatedService:
+    """An in-memory service emulating a remote API.
+
+    Args:
+        initial ({key: item}): initial items
+        latency (float): seconds spent in each request
+        jitter (float): random extra latency, up to that many seconds
+        page_size (int): items per listing page
+        max_batch_size (int): maximum items per write request
+        rate (float): allowed requests per second; None for no limit
+        burst (int): number of requests allowed in a row, with rate
+        error_rate (float): probability of a request failing with a TransientError
+        rejected (key iterable): keys refused by write requests; updates
+            to missing keys are always refused
+        seed: seed for jitter and error injection
+    """
+
+    def __init__(
+            self, initial=None, *,
+            latency=0.0, jitter=0.0, page_size=100, max_batch_size=100,
+            rate=None, burst=1, error_rate=0.0, rejected=(), seed=None):
+        self.items = dict(initial or {})
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.max_batch_size = max_batch_size
+        self.rate = rate
+        self.burst = burst
+        self.error_rate = error_rate
+        self.rejected = frozenset(rejected)
+
+        #: Request counters: 'requests', 'throttled', 'errors', and per kind
+        self.stats = collections.Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+        # Sorted keys for listings, reset when keys are added or removed
+        self._sorted_keys = None
+
+    def _request(self, kind):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats[kind] += 1
+
+            if self.rate is not None:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+                self._refilled_at = now
+                if self._tokens < 1:
+                    self.stats['throttled'] += 1
+                    raise RateLimited((1 - self._tokens) / self.rate)
+                self._tokens -= 1
+
+            delay = self.latency + self._random.random() * self.jitter
+            failed = self._random.random() < self.error_rate
+
+        # Sleep outside the lock: concurrent requests overlap, as on a real server.
+        time.sleep(delay)
+        if failed:
+            with self._lock:
+                self.stats['errors'] += 1
+            raise TransientError("Injected failure for %s request" % kind)
+
+    def list(self, page_token=None):
+        """Return a ({key: item}, next_page_token) page; the last token is None."""
+        self._request('list')
+        start = page_token or 0
+        with self._lock:
+            if self._sorted_keys is None:
+                self._sorted_keys = sorted(self.items)
+            keys = self._sorted_keys[start:start + self.page_size]
+            page = {key: self.items[key] for key in keys}
+            total = len(self.items)
+        end = start + self.page_size
+        return page, (end if end < total else None)
+
+    def fetch(self, key):
+        self._request('fetch')
+        with self._lock:
+            return self.items.get(key)
+
+    def _write(self, kind, keys):
+        if len(keys) > self.max_batch_size:
+            raise ValueError("Batch of %d items exceeds the %d limit" % (len(keys), self.max_batch_size))
+        self._request(kind)
+        rejected = self.rejected.intersection(keys)
+        if rejected:
+            raise RejectedItems(rejected)
+
+    def create(self, items):
+        self._write('create', items)
+        with self._lock:
+            self.items.update(items)
+            self._sorted_keys = None
+
+    def update(self, items):
+        self._write('update', items)
+        with self._lock:
+            missing = set(items).difference(self.items)
+            if missing:
+                raise RejectedItems(missing)
+            self.items.update(items)
+
+    def delete(self, keys):
+        self._write('delete', keys)
+        with self._lock:
+            for key in keys:
+                self.items.pop(key, None)
+            self._sorted_keys = None
+
+
+class _EmulatedClient:
+    def __init__(self, service, *, name='emulated', retries=5, backoff=0.01):
+        self.service = service
+        self.name = name
+        self.retries = retries
+        self.backoff = backoff
+
+    def _connect(self):
+        pass
+
+    def _disconnect(self):
+        pass
+
+    def _call(self, method, *args):
+        """Call a service method, retrying transient errors."""
+        for attempt in range(self.retries + 1):
+            try:
+                return method(*args)
+            except RateLimited as e:
+                if attempt == self.retries:
+                    raise
+                time.sleep(e.retry_after)
+            except TransientError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def all(self):
+        items = {}
+        page_token = None
+        while True:
+            page, page_token = self._call(self.service.list, page_token)
+            items.update(page)
+            if page_token is None:
+                return items
+
+    def get(self, key):
+        return self._call(self.service.fetch, key)
+
+    def __str__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.name)
+
+
+class EmulatedSource(_EmulatedClient, DataSource):
+    pass
+
+
+class EmulatedSink(_EmulatedClient, DataSink):
+    """A DataSink writing to an EmulatedService.
+
+    Args:
+        batch_size (int): items per write request; defaults to the service's limit
+    """
+
+    def __init__(self, service, *, batch_size=None, **kwargs):
+        super().__init__(service, **kwargs)
+        self.batch_size = batch_size or service.max_batch_size
+
+    def merge(self, base, updated):
+        if base == updated:
+            return None
+        return (base, updated)
+
+    def _chunks(self, keys):
+        keys = list(keys)
+        for start in range(0, len(keys), self.batch_size):
+            yield keys[start:start + self.batch_size]
+
+    def create_batch(self, changes):
+        for keys in self._chunks(changes):
+            self._call(self.service.create, {key: changes[key].target for key in keys})
+
+    def update_batch(self, changes):
+        for keys in self._chunks(changes):
+            self._call(self.service.update, {key: changes[key].target for key in keys})
+
+    def delete_batch(self, changes):
+        for keys in self._chunks(changes):
+            self._call(self.service.delete, keys)
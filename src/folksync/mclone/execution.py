@@ -0,0 +1,180 @@
+import collections
+import concurrent.futures
+import threading
+import time
+
+
+class BatchExecutor:
+    """Send each batch to its handler at once; errors are propagated.
+
+    Executors return the {key => exception} of the changes that failed.
+    """
+
+    def execute(self, batch, interactor):
+        batch.handler(batch.changes)
+        return {}
+
+
+class BisectingExecutor(BatchExecutor):
+    """Isolate failing changes by splitting failed batches in halves.
+
+    A batch of N changes with a single bad item is fully applied with about
+    2 * log2(N) extra calls. Handlers must be safe to call again with changes
+    from a failed call, i.e. either atomic or idempotent.
+
+    Args:
+        exceptions (Exception class tuple): the errors caused by bad items;
+            other errors are propagated.
+    """
+
+    def __init__(self, *, exceptions=(Exception,)):
+        self.exceptions = exceptions
+
+    def execute(self, batch, interactor):
+        failures = {}
+        # Stack of pending chunks, the next one last.
+        pending = [list(batch.changes.items())]
+        while pending:
+            chunk = pending.pop()
+            try:
+                batch.handler(dict(chunk))
+            except self.exceptions as e:
+                if len(chunk) == 1:
+                    key, _change = chunk[0]
+                    failures[key] = e
+                else:
+                    middle = len(chunk) // 2
+                    pending.append(chunk[middle:])
+                    pending.append(chunk[:middle])
+        return failures
+
+
+#: TuningDecision: new settings chosen by an AIMDController
+#: Attributes:
+#: - batch_size (int): changes per handler call
+#: - concurrency (int): handler calls in flight
+#: - latency (float): slowest call of the last round, in seconds
+#: - errors (int): failed calls in the last round
+#: - reason (text): why the settings changed
+TuningDecision = collections.namedtuple(
+    'TuningDecision',
+    ['batch_size', 'concurrency', 'latency', 'errors', 'reason'],
+)
+
+
+class AIMDController:
+    """Additive-increase / multiplicative-decrease tuning for a sink.
+
+    After each round of concurrent calls, settings grow by a fixed step if
+    all calls succeeded within target_latency, and are multiplied by
+    ``decrease`` otherwise.
+    """
+
+    def __init__(
+            self, *,
+            batch_size=10, min_batch_size=1, max_batch_size=1000, batch_step=10,
+            concurrency=1, max_concurrency=8, target_latency=1.0, decrease=0.5):
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.batch_step = batch_step
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.decrease = decrease
+
+    def record(self, latencies, errors):
+        """Update settings from a round's call latencies; returns a TuningDecision, or None."""
+        latency = max(latencies) if latencies else 0.0
+        if errors:
+            reason = "%d failed calls" % errors
+            batch_size = int(self.batch_size * self.decrease)
+            concurrency = int(self.concurrency * self.decrease)
+        elif latency > self.target_latency:
+            reason = "latency %.3fs above %.3fs target" % (latency, self.target_latency)
+            batch_size = int(self.batch_size * self.decrease)
+            concurrency = int(self.concurrency * self.decrease)
+        else:
+            reason = "latency %.3fs within %.3fs target" % (latency, self.target_latency)
+            batch_size = self.batch_size + self.batch_step
+            concurrency = self.concurrency + 1
+
+        batch_size = min(self.max_batch_size, max(self.min_batch_size, batch_size))
+        concurrency = min(self.max_concurrency, max(1, concurrency))
+        if (batch_size, concurrency) == (self.batch_size, self.concurrency):
+            return None
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        return TuningDecision(
+            batch_size=batch_size,
+            concurrency=concurrency,
+            latency=latency,
+            errors=errors,
+            reason=reason,
+        )
+
+
+class AdaptiveExecutor(BatchExecutor):
+    """Split batches into concurrent calls, tuned per sink by an AIMDController.
+
+    Decisions are reported through ``interactor.notify_tuning()``. Handlers
+    are called from several threads at once, and must support it.
+
+    Args:
+        fallback (BatchExecutor): retries failed calls, e.g. a BisectingExecutor;
+            the default BatchExecutor retries once, then propagates the error.
+        exceptions (Exception class tuple): errors handed to the fallback
+        controller_options: passed to each sink's AIMDController
+    """
+
+    def __init__(self, *, fallback=None, exceptions=(Exception,), **controller_options):
+        self.fallback = fallback or BatchExecutor()
+        self.exceptions = exceptions
+        self.controller_options = controller_options
+        # sink => AIMDController, kept across batches and runs
+        self.controllers = {}
+        self._lock = threading.Lock()
+
+    def get_controller(self, sink):
+        with self._lock:
+            if sink not in self.controllers:
+                self.controllers[sink] = AIMDController(**self.controller_options)
+            return self.controllers[sink]
+
+    def execute(self, batch, interactor):
+        controller = self.get_controller(batch.sink)
+        items = list(batch.changes.items())
+        failures = {}
+        position = 0
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=controller.max_concurrency) as pool:
+            while position < len(items):
+                chunks = []
+                for _index in range(controller.concurrency):
+                    if position >= len(items):
+                        break
+                    chunks.append(items[position:position + controller.batch_size])
+                    position += controller.batch_size
+
+                futures = [pool.submit(self._call, batch.handler, dict(chunk)) for chunk in chunks]
+                results = [future.result() for future in futures]
+
+                errors = 0
+                for chunk, (_latency, error) in zip(chunks, results):
+                    if error is not None:
+                        errors += 1
+                        failures.update(self.fallback.execute(batch._replace(changes=dict(chunk)), interactor))
+
+                decision = controller.record([latency for latency, _error in results], errors)
+                if decision is not None:
+                    interactor.notify_tuning(batch.sink, batch.action, decision)
+
+        return failures
+
+    def _call(self, handler, changes):
+        start = time.monotonic()
+        try:
+            handler(changes)
+        except self.exceptions as e:
+            return time.monotonic() - start, e
+        return time.monotonic() - start, None
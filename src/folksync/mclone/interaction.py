@@ -5,6 +5,10 @@ from .datastructs import Action, ReplicationMode, ReplicationStepState
 
 
 class BaseDecider:
+    #: The number of steps choose_mode() may lower a run's mode by, at most;
+    #: None if unbounded. Subclasses lowering the mode further must override it.
+    max_downgrade = 0
+
     def choose_mode(self, context, mode):
         return mode
 
@@ -58,26 +62,43 @@ class BaseInteractor:
             )
         return new_mode
 
-    def notify_step(self, sink, action, state, context):
+    def notify_step(self, sink, action, state, context, changes=None):
         state_map = {
             ReplicationStepState.EMPTY: "Nothing to do",
             ReplicationStepState.SKIPPED: "Disabled",
             ReplicationStepState.START: "Start",
             ReplicationStepState.SUCCESS: "Success",
+            ReplicationStepState.PARTIAL: "Partial failure",
         }
 
+        if changes is None:
+            changes = context.changes[sink][action]
+
         width = str(len(str(len(context.keys))))
         self.printer.display(
             "Sink %(sink)s: %(action)s %(items)" + width + "d items: " + state_map[state],
             dict(
                 action=action.name,
                 sink=sink,
-                items=len(context.changes[sink][action]),
+                items=len(changes),
             ),
         )
+        if state == ReplicationStepState.PARTIAL:
+            failures = context.failures[sink][action]
+            for key in sorted(changes):
+                if key not in failures:
+                    continue
+                self.printer.display(
+                    "Sink %(sink)s: %(action)s: %(key)s failed: %(error)r",
+                    dict(
+                        sink=sink,
+                        action=action.name,
+                        key=key,
+                        error=failures[key],
+                    ),
+                )
         if state != ReplicationStepState.START:
             return
-        changes = context.changes[sink][action]
         for key, change in sorted(changes.items()):
             self.printer.display(
                 "Sink %(sink)s: %(action)s: %(key)s %(delta)s",
@@ -89,8 +110,45 @@ class BaseInteractor:
                 ),
             )
 
+    def notify_tuning(self, sink, action, decision):
+        self.printer.display(
+            "Sink %(sink)s: %(action)s: now sending %(batch_size)d items per call, "
+            "%(concurrency)d calls in flight (%(reason)s)",
+            dict(
+                sink=sink,
+                action=action.name,
+                batch_size=decision.batch_size,
+                concurrency=decision.concurrency,
+                reason=decision.reason,
+            ),
+        )
+
+    def notify_divergences(self, context):
+        if not context.divergences:
+            self.printer.display(
+                "Verified %(sinks)d sinks: no divergent items",
+                dict(
+                    sinks=len(context.sinks),
+                ),
+            )
+            return
+        for sink, sink_changes in context.divergences.items():
+            for action, changes in sorted(sink_changes.items(), key=lambda item: item[0].value):
+                for key, change in sorted(changes.items()):
+                    self.printer.display(
+                        "Sink %(sink)s: diverged, needs %(action)s: %(key)s %(delta)s",
+                        dict(
+                            sink=sink,
+                            action=action.name,
+                            key=key,
+                            delta=change.delta,
+                        ),
+                    )
+
 
 class ThresholdDecider(BaseDecider):
+    max_downgrade = 1
+
     def __init__(
             self, *,
             common_ratio=0.1, created_ratio=None, updated_ratio=None,
@@ -120,6 +178,9 @@ class ThresholdDecider(BaseDecider):
 
 
 class ShellDecider:
+    # The operator may pick any mode, including DRY_RUN.
+    max_downgrade = None
+
     def __init__(self, *, stdout=sys.stdout, stderr=sys.stderr, stdin=sys.stdin):
         self.stdout = stdout
         self.stderr = stderr
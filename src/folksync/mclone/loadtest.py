@@ -0,0 +1,146 @@
+"""Load test driver: replicate a generated directory to emulated services.
+
+Usage: python -m folksync.mclone.loadtest --items 10000 --sinks 3 --latency 0.005
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from . import emulation
+from . import execution
+from . import interaction
+from . import syncer
+from .datastructs import Action, ReplicationMode
+
+
+def generate_items(count, *, seed=0):
+    rng = random.Random(seed)
+    groups = ['group%02d' % i for i in range(20)]
+    return {
+        'user%06d' % i: {
+            'name': 'User %d' % i,
+            'email': 'user%06d@example.org' % i,
+            'groups': sorted(rng.sample(groups, 3)),
+        }
+        for i in range(count)
+    }
+
+
+def drift_items(items, ratio, *, seed=0):
+    """Return a copy of items with a share of them modified, removed or added."""
+    rng = random.Random(seed)
+    drifted = {}
+    for key, item in sorted(items.items()):
+        roll = rng.random()
+        if roll < ratio / 3:
+            continue  # Missing on the sink => created
+        elif roll < 2 * ratio / 3:
+            drifted[key] = dict(item, name=item['name'].upper())
+        else:
+            drifted[key] = item
+    for i in range(int(len(items) * ratio / 3)):
+        drifted['stale%06d' % i] = {'name': 'Stale %d' % i, 'email': None, 'groups': []}
+    return drifted
+
+
+def run(
+        *, items=1000, sinks=2, drift=0.1, mode=ReplicationMode.FULL,
+        executor=None, seed=0, batch_size=None, **service_options):
+    """Run a single replication against emulated services.
+
+    Extra keyword arguments are passed to each EmulatedService.
+
+    Returns:
+        dict: 'elapsed' seconds, 'context', 'services' and 'changes' per action
+    """
+    source_data = generate_items(items, seed=seed)
+    source = emulation.EmulatedSource(
+        emulation.EmulatedService(source_data, page_size=service_options.get('page_size', 100)),
+        name='source',
+    )
+    services = [
+        emulation.EmulatedService(
+            drift_items(source_data, drift, seed=seed + i),
+            seed=seed + i,
+            **service_options
+        )
+        for i in range(sinks)
+    ]
+    replicator = syncer.Replicator(
+        source=source,
+        sinks=[
+            emulation.EmulatedSink(service, name='sink%d' % i, batch_size=batch_size)
+            for i, service in enumerate(services)
+        ],
+        interactor=interaction.BaseInteractor(),
+        executor=executor,
+    )
+
+    start = time.monotonic()
+    context = replicator.replicate(mode)
+    elapsed = time.monotonic() - start
+
+    return {
+        'elapsed': elapsed,
+        'context': context,
+        'services': services,
+        'changes': {
+            action: sum(len(sink_changes[action]) for sink_changes in context.changes.values())
+            for action in Action
+        },
+    }
+
+
+def main(argv=None, stdout=sys.stdout):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--sinks', type=int, default=2)
+    parser.add_argument('--drift', type=float, default=0.1, help="Share of items differing on each sink")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds per request")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--max-batch-size', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--rate', type=float, default=None, help="Requests per second")
+    parser.add_argument('--burst', type=int, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--bisect', action='store_true', help="Isolate failing items instead of aborting")
+    parser.add_argument('--adaptive', action='store_true', help="Tune batch size and concurrency per sink")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    executor = execution.BisectingExecutor() if args.bisect else None
+    if args.adaptive:
+        executor = execution.AdaptiveExecutor(fallback=executor, max_batch_size=args.max_batch_size)
+
+    result = run(
+        items=args.items,
+        sinks=args.sinks,
+        drift=args.drift,
+        executor=executor,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        latency=args.latency,
+        jitter=args.jitter,
+        page_size=args.page_size,
+        max_batch_size=args.max_batch_size,
+        rate=args.rate,
+        burst=args.burst,
+        error_rate=args.error_rate,
+    )
+
+    stdout.write("Replicated %d items to %d sinks in %.3fs\n" % (args.items, args.sinks, result['elapsed']))
+    stdout.write("Changes: %s\n" % ', '.join(
+        '%s=%d' % (action.name.lower(), count)
+        for action, count in sorted(result['changes'].items(), key=lambda item: item[0].value)
+    ))
+    for i, service in enumerate(result['services']):
+        stdout.write("sink%d: %s\n" % (i, ', '.join(
+            '%s=%d' % (name, count) for name, count in sorted(service.stats.items())
+        )))
+
+
+if __name__ == '__main__':
+    main()
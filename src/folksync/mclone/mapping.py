@@ -0,0 +1,164 @@
+"""Declarative attribute mappings, compiled into specialised merge functions.
+
+Example::
+
+    class SlackSink(DataSink):
+        attribute_mapping = AttributeMapping([
+            Rename('uid', 'login'),
+            Transform('cn', str.title, target='display_name'),
+            AsSet('groups'),
+            Ignore('photo'),
+        ], copy_others=True)
+"""
+
+import collections
+
+from .records import freeze
+
+
+#: Rule: how a source attribute is mapped to a sink attribute
+#: Attributes:
+#: - source (text): the source attribute
+#: - target (text): the sink attribute
+#: - transform (callable): converts the source value; None to keep it as is
+#: - as_set (bool): compare values as unordered sets
+#: - ignore (bool): never compare nor copy that attribute
+Rule = collections.namedtuple('Rule', ['source', 'target', 'transform', 'as_set', 'ignore'])
+
+
+def Copy(*attributes):
+    return [Rule(source=a, target=a, transform=None, as_set=False, ignore=False) for a in attributes]
+
+
+def Rename(source, target):
+    return Rule(source=source, target=target, transform=None, as_set=False, ignore=False)
+
+
+def Transform(source, transform, target=None):
+    return Rule(source=source, target=target or source, transform=transform, as_set=False, ignore=False)
+
+
+def AsSet(source, target=None, transform=None):
+    return Rule(source=source, target=target or source, transform=transform, as_set=True, ignore=False)
+
+
+def Ignore(attribute):
+    return Rule(source=attribute, target=attribute, transform=None, as_set=False, ignore=True)
+
+
+#: AttributeDelta: the change of a single sink attribute
+AttributeDelta = collections.namedtuple('AttributeDelta', ['attribute', 'previous', 'target'])
+
+
+class Delta(tuple):
+    """A tuple of AttributeDelta, as returned by compiled merge functions."""
+
+    __slots__ = ()
+
+    def as_dict(self):
+        return {d.attribute: d.target for d in self}
+
+    def __str__(self):
+        return ', '.join('%s: %r -> %r' % d for d in self)
+
+
+class AttributeMapping:
+    """A set of rules, compiled into merge() and project() functions.
+
+    Args:
+        rules (Rule list): the mapping rules; lists of rules are flattened
+        copy_others (bool): copy and compare source attributes not mentioned in rules;
+            sink-only attributes are always left alone.
+    """
+
+    def __init__(self, rules, *, copy_others=False):
+        self.rules = []
+        for rule in rules:
+            self.rules.extend(rule if isinstance(rule, list) else [rule])
+        self.copy_others = copy_others
+
+        targets = collections.Counter(rule.target for rule in self.rules if not rule.ignore)
+        duplicates = sorted(target for target, count in targets.items() if count > 1)
+        if duplicates:
+            raise ValueError("Several rules set attributes %s" % ', '.join(duplicates))
+
+        self.merge = self._compile_merge()
+        self.project = self._compile_project()
+
+    def _namespace(self):
+        namespace = {
+            'AttributeDelta': AttributeDelta,
+            'Delta': Delta,
+            '_EMPTY': {},
+            '_freeze': freeze,
+            '_sources': frozenset(rule.source for rule in self.rules),
+            '_targets': frozenset(rule.target for rule in self.rules),
+        }
+        for index, rule in enumerate(self.rules):
+            namespace['_source%d' % index] = rule.source
+            namespace['_target%d' % index] = rule.target
+            namespace['_transform%d' % index] = rule.transform
+        return namespace
+
+    def _value_lines(self, index, rule):
+        """Code computing `value`, the expected sink value for a rule."""
+        value = "updated.get(_source%d)" % index
+        if rule.transform is not None:
+            return [
+                "value = %s" % value,
+                "if value is not None:",
+                "    value = _transform%d(value)" % index,
+            ]
+        return ["value = %s" % value]
+
+    def _compile(self, name, arguments, lines):
+        source = "def %s(%s):\n%s\n" % (name, arguments, '\n'.join('    ' + line for line in lines))
+        namespace = self._namespace()
+        exec(compile(source, '<%s %s>' % (self.__class__.__name__, name), 'exec'), namespace)
+        function = namespace[name]
+        function.source = source
+        return function
+
+    def _compile_merge(self):
+        lines = [
+            "if base is None:",
+            "    base = _EMPTY",
+            "delta = []",
+        ]
+        for index, rule in enumerate(self.rules):
+            if rule.ignore:
+                continue
+            lines.extend(self._value_lines(index, rule))
+            lines.append("previous = base.get(_target%d)" % index)
+            if rule.as_set:
+                lines.append("if set(previous or ()) != set(value or ()):")
+            else:
+                # Frozen records hold tuples where sinks may return lists.
+                lines.append("if previous != value and _freeze(previous) != _freeze(value):")
+            lines.append("    delta.append(AttributeDelta(_target%d, previous, value))" % index)
+
+        if self.copy_others:
+            lines.extend([
+                "for key, value in updated.items():",
+                "    if key not in _sources and key not in _targets and base.get(key) != value"
+                " and _freeze(base.get(key)) != _freeze(value):",
+                "        delta.append(AttributeDelta(key, base.get(key), value))",
+            ])
+        lines.append("return Delta(delta) if delta else None")
+        return self._compile('merge', 'base, updated', lines)
+
+    def _compile_project(self):
+        lines = ["result = {}"]
+        for index, rule in enumerate(self.rules):
+            if rule.ignore:
+                continue
+            lines.extend(self._value_lines(index, rule))
+            lines.append("result[_target%d] = value" % index)
+        if self.copy_others:
+            lines.extend([
+                "for key, value in updated.items():",
+                "    if key not in _sources and key not in _targets:",
+                "        result[key] = value",
+            ])
+        lines.append("return result")
+        return self._compile('project', 'updated', lines)
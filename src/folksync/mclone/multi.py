@@ -0,0 +1,122 @@
+import collections
+import concurrent.futures
+
+from .datastructs import Action, ReplicationContext
+from .syncer import Replicator, take_snapshot
+
+
+def dependency_waves(names, dependencies):
+    """Sort collection names into waves; each wave only depends on previous ones.
+
+    Args:
+        names (text list): all collection names
+        dependencies ({text: text list}): the names each collection depends on
+
+    Returns:
+        text list list: the names in each wave, sorted
+    """
+    names = list(names)
+    pending = {name: set(dependencies.get(name, ())) for name in names}
+    for name, deps in sorted(pending.items()):
+        unknown = deps - set(names)
+        if unknown:
+            raise ValueError(
+                "Collection %r depends on unknown collections %s" % (name, ', '.join(sorted(unknown))))
+
+    waves = []
+    while pending:
+        wave = sorted(name for name, deps in pending.items() if not deps)
+        if not wave:
+            raise ValueError(
+                "Circular dependency between collections %s" % ', '.join(sorted(pending)))
+        for name in wave:
+            del pending[name]
+        for deps in pending.values():
+            deps.difference_update(wave)
+        waves.append(wave)
+    return waves
+
+
+class MultiReplicator(Replicator):
+    """Replicate several related collections from a single source snapshot.
+
+    The source's all() returns a {collection => {key => item}} snapshot,
+    fetched once and diffed against every collection of every MultiDataSink.
+    Creations and updates run in dependency order, deletions in reverse
+    order; collections within a wave are applied by up to ``workers`` threads.
+    """
+
+    def __init__(
+            self, source, sinks, interactor,
+            verifier=None, scheduler=None, profiler=None, executor=None, workers=1):
+        super().__init__(
+            source, sinks, interactor,
+            verifier=verifier, scheduler=scheduler, profiler=profiler, executor=executor,
+        )
+        self.workers = workers
+
+    def _replicate(self, mode, only_keys, snapshot):
+        # snapshot.data is a {collection => {key => item}} dict
+        snapshot = self._fetch_source(snapshot)
+
+        # As in Replicator, but changes are indexed by collection sink.
+        # Keys from different collections may collide: count (name, key) pairs.
+        changes = collections.OrderedDict()
+        stats = {action: set() for action in Action}
+        keys = set()
+        # waves[n]: the collection sinks at depth n, across all sinks
+        waves = []
+
+        for multi_sink in self.sinks:
+            sink_collections = multi_sink.collections()
+            sorted_names = dependency_waves(sink_collections, multi_sink.dependencies())
+            for depth, names in enumerate(sorted_names):
+                if depth == len(waves):
+                    waves.append([])
+                waves[depth].extend(sink_collections[name] for name in names)
+
+            for name, sink in sink_collections.items():
+                collection_snapshot = take_snapshot(snapshot.data.get(name, {}))
+                keys.update((name, key) for key in collection_snapshot.keys)
+                sink_changes = self._diff_sink(sink, collection_snapshot, only_keys)
+                for action, action_changes in sink_changes.items():
+                    stats[action].update((name, key) for key in action_changes)
+                changes[sink] = sink_changes
+
+        context = ReplicationContext(
+            source=self.source,
+            sinks=list(changes),
+            keys=keys,
+            changes=changes,
+            stats={action: len(stats[action]) for action in Action},
+            divergences=collections.OrderedDict(),
+            failures=collections.OrderedDict(),
+        )
+
+        mode = self._choose_mode(context, mode)
+
+        applied = collections.OrderedDict((sink, {}) for sink in changes)
+        for wave in waves:
+            self._run_wave(wave, [Action.CREATED, Action.UPDATED], mode, context, applied)
+        for wave in reversed(waves):
+            self._run_wave(wave, [Action.DELETED], mode, context, applied)
+        self._verify(context, applied)
+
+        return context
+
+    def _run_wave(self, sinks, actions, mode, context, applied):
+        sink_steps = [
+            self._prepare_steps(sink=sink, actions=actions, mode=mode, context=context)
+            for sink in sinks
+        ]
+        sink_steps = [steps for steps in sink_steps if steps]
+        if not sink_steps:
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                executor.submit(self._apply, steps, context, applied)
+                for steps in sink_steps
+            ]
+            for future in futures:
+                future.result()
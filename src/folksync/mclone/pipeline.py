@@ -0,0 +1,94 @@
+import collections
+import concurrent.futures
+
+from .datastructs import Action, ReplicationContext, ReplicationMode
+from .syncer import APPLY_MODES, Replicator
+
+
+class PipelinedReplicator(Replicator):
+    """Start applying changes to each sink as soon as it has been diffed.
+
+    Sinks are fetched and diffed in parallel. As soon as a sink's diff is
+    ready, the actions allowed one mode below the requested one are applied
+    in the background (creations and updates for a FULL run, nothing for an
+    ADDITIVE one). Once all sinks are diffed, the interactor decides a single
+    mode over all changes, and the remaining actions are applied if allowed.
+
+    Deciders lowering the mode by at most one step, like ThresholdDecider,
+    thus keep the same guarantees as with a Replicator. With any other
+    decider (e.g. a ShellDecider, whose operator may choose DRY_RUN), or
+    one without a ``max_downgrade``, nothing is applied before the decision:
+    sinks are still diffed in parallel.
+    """
+
+    def __init__(
+            self, source, sinks, interactor,
+            verifier=None, scheduler=None, profiler=None, executor=None, workers=None):
+        super().__init__(
+            source, sinks, interactor,
+            verifier=verifier, scheduler=scheduler, profiler=profiler, executor=executor,
+        )
+        self.workers = workers or 2 * len(sinks) or 1
+
+    def _replicate(self, mode, only_keys, snapshot):
+        snapshot = self._fetch_source(snapshot)
+
+        # Filled as sinks are diffed; shared with the apply threads.
+        changes = collections.OrderedDict()
+        stats = {action: set() for action in Action}
+        context = ReplicationContext(
+            source=self.source,
+            sinks=self.sinks,
+            keys=snapshot.keys,
+            changes=changes,
+            stats={action: 0 for action in Action},
+            divergences=collections.OrderedDict(),
+            failures=collections.OrderedDict(),
+        )
+        applied = collections.OrderedDict((sink, {}) for sink in self.sinks)
+
+        modes = list(ReplicationMode)
+        early_mode = modes[max(0, modes.index(mode) - 1)]
+        actions = [Action.CREATED, Action.UPDATED, Action.DELETED]
+        if self._max_downgrade() in (0, 1):
+            early_actions = [action for action in actions if early_mode in APPLY_MODES[action]]
+        else:
+            early_actions = []
+        late_actions = [action for action in actions if action not in early_actions]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            diffs = {
+                executor.submit(self._diff_sink, sink, snapshot, only_keys): sink
+                for sink in self.sinks
+            }
+            applies = []
+            for future in concurrent.futures.as_completed(diffs):
+                sink = diffs[future]
+                sink_changes = future.result()
+                for action, action_changes in sink_changes.items():
+                    stats[action].update(action_changes)
+                changes[sink] = sink_changes
+
+                steps = self._prepare_steps(sink=sink, actions=early_actions, mode=early_mode, context=context)
+                if steps:
+                    applies.append(executor.submit(self._apply, steps, context, applied))
+
+            # All sinks are diffed: take a single decision on the whole run.
+            context.stats.update((action, len(stats[action])) for action in Action)
+            mode = self._choose_mode(context, mode)
+
+            for sink in changes:
+                steps = self._prepare_steps(sink=sink, actions=late_actions, mode=mode, context=context)
+                if steps:
+                    applies.append(executor.submit(self._apply, steps, context, applied))
+
+            for future in applies:
+                future.result()
+
+        self._verify(context, applied)
+        return context
+
+    def _max_downgrade(self):
+        """How many steps the interactor's decider may lower the mode by; None if unknown."""
+        decider = getattr(self.interactor, 'decider', None)
+        return getattr(decider, 'max_downgrade', None)
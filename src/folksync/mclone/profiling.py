@@ -0,0 +1,207 @@
+import collections
+import os
+import sys
+import threading
+
+
+#: Environment variable enabling profiling; holds the output directory
+ENV_VAR = 'FOLKSYNC_PROFILE'
+
+COLLAPSED_FILENAME = 'folksync.collapsed'
+SUMMARY_FILENAME = 'folksync-top.txt'
+
+
+class NullProfiler:
+    """Default profiler: does nothing."""
+
+    def section(self, *tags):
+        return _NullSection()
+
+    def write(self):
+        return []
+
+
+class _NullSection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class SharedProfiler:
+    """Forward sections to a profiler shared between several runs.
+
+    write() does nothing: results are written once by the profiler's owner,
+    after all runs have finished.
+    """
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def section(self, *tags):
+        return self.profiler.section(*tags)
+
+    def write(self):
+        return []
+
+
+class SamplingProfiler:
+    """Sample the stacks of threads running within tagged sections.
+
+    Samples are collected by a background thread, and written as:
+    - ``folksync.collapsed``: collapsed stacks, one ``tag;...;frame count``
+      line per stack, as consumed by flamegraph.pl or speedscope;
+    - ``folksync-top.txt``: the ``top`` hottest functions.
+
+    Args:
+        output_dir (text): where to write the results
+        interval (float): seconds between samples
+        top (int): number of functions in the summary
+    """
+
+    def __init__(self, output_dir, *, interval=0.005, top=20):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.top = top
+        self.samples = collections.Counter()
+
+        self._lock = threading.Lock()
+        # Thread ident => (tags, depth of the outermost section's caller)
+        self._active = {}
+        # Event stopping the running sampler thread, if any
+        self._sampler = None
+
+    def section(self, *tags):
+        return _Section(self, [str(tag).replace(';', ',') for tag in tags])
+
+    def _enter(self, tags, frame):
+        ident = threading.get_ident()
+        with self._lock:
+            if ident in self._active:
+                previous, depth = self._active[ident]
+                self._active[ident] = (previous + tags, depth)
+            else:
+                # Outermost section: only keep frames from its caller downwards.
+                previous = None
+                self._active[ident] = (tags, _depth(frame))
+            if self._sampler is None:
+                self._sampler = threading.Event()
+                thread = threading.Thread(
+                    target=self._run, args=(self._sampler,), name='folksync-profiler', daemon=True,
+                )
+                thread.start()
+        return previous
+
+    def _exit(self, previous):
+        ident = threading.get_ident()
+        with self._lock:
+            if previous is not None:
+                self._active[ident] = (previous, self._active[ident][1])
+            else:
+                del self._active[ident]
+            if not self._active and self._sampler is not None:
+                self._sampler.set()
+                self._sampler = None
+
+    def _run(self, stopping):
+        while not stopping.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            active = dict(self._active)
+        stacks = []
+        for ident, (tags, depth) in active.items():
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+            stacks.append(';'.join(tags + stack[depth - 1:]))
+        with self._lock:
+            self.samples.update(stacks)
+
+    def write(self):
+        """Write and reset collected samples; returns the written paths.
+
+        Each call overwrites the previous results, with the samples taken since.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        collapsed_path = os.path.join(self.output_dir, COLLAPSED_FILENAME)
+        summary_path = os.path.join(self.output_dir, SUMMARY_FILENAME)
+        with self._lock:
+            samples = dict(self.samples)
+            self.samples.clear()
+
+        with open(collapsed_path, 'w') as f:
+            for stack, count in sorted(samples.items()):
+                f.write('%s %d\n' % (stack, count))
+
+        with open(summary_path, 'w') as f:
+            f.write(self.summary(samples))
+
+        return [collapsed_path, summary_path]
+
+    def summary(self, samples=None):
+        if samples is None:
+            with self._lock:
+                samples = dict(self.samples)
+        total = sum(samples.values()) or 1
+        own = collections.Counter()
+        cumulated = collections.Counter()
+        for stack, count in samples.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                cumulated[frame] += count
+
+        lines = ["%8s %8s  %s" % ('self%', 'total%', 'function')]
+        for label, count in own.most_common(self.top):
+            lines.append("%7.1f%% %7.1f%%  %s" % (
+                100.0 * count / total,
+                100.0 * cumulated[label] / total,
+                label,
+            ))
+        return ''.join(line + '\n' for line in lines)
+
+
+class _Section:
+    def __init__(self, profiler, tags):
+        self.profiler = profiler
+        self.tags = tags
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = self.profiler._enter(self.tags, sys._getframe(1))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler._exit(self.previous)
+        return False
+
+
+def _depth(frame):
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+def _label(frame):
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+def from_environ(environ=None, **kwargs):
+    """Build a SamplingProfiler if enabled through FOLKSYNC_PROFILE, else None."""
+    environ = os.environ if environ is None else environ
+    output_dir = environ.get(ENV_VAR)
+    if not output_dir:
+        return None
+    return SamplingProfiler(output_dir, **kwargs)
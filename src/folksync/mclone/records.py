@@ -0,0 +1,172 @@
+import collections.abc
+import weakref
+
+from .base import DataSource
+
+
+_MISSING = object()
+
+
+class Record(collections.abc.Mapping):
+    """An immutable directory item.
+
+    Values are frozen on creation: dicts become Records, lists and tuples
+    become tuples, sets become frozensets; a Record is equal to any mapping
+    with the same frozen values. Derived records share all
+    unchanged values with their parent, and per-sink projections are
+    computed once per record and cached.
+    """
+
+    __slots__ = ('_data', '_hash', '_projections', '__weakref__')
+
+    def __init__(self, data=(), **kwargs):
+        data = dict(data, **kwargs)
+        self._data = {key: freeze(value) for key, value in data.items()}
+        self._hash = None
+        self._projections = None
+
+    @classmethod
+    def _from_frozen(cls, data):
+        record = cls.__new__(cls)
+        record._data = data
+        record._hash = None
+        record._projections = None
+        return record
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self._data.items()))
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if isinstance(other, Record):
+            return hash(self) == hash(other) and self._data == other._data
+        if isinstance(other, collections.abc.Mapping):
+            # Plain data, e.g. from a sink: compare value by value, only
+            # freezing values which differ, e.g. a list against a tuple.
+            if len(other) != len(self._data):
+                return False
+            for key, value in self._data.items():
+                other_value = other.get(key, _MISSING)
+                if value != other_value and (
+                        other_value is _MISSING
+                        or isinstance(other_value, collections.abc.Mapping)
+                        or value != freeze(other_value)):
+                    return False
+            return True
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self._data)
+
+    def __reduce__(self):
+        return (self.__class__, (self._data,))
+
+    def evolve(self, **changes):
+        """Return a copy with some attributes replaced; other values are shared."""
+        data = dict(self._data)
+        data.update((key, freeze(value)) for key, value in changes.items())
+        return self._from_frozen(data)
+
+    def without(self, *keys):
+        """Return a copy without some attributes; other values are shared."""
+        return self._from_frozen({key: value for key, value in self._data.items() if key not in keys})
+
+    def project(self, name, projection):
+        """Return projection(self), computed once per record and name.
+
+        Args:
+            name (text): the cache key, e.g. the sink name
+            projection (callable): builds the sink-specific representation
+        """
+        if self._projections is None:
+            self._projections = {}
+        try:
+            return self._projections[name]
+        except KeyError:
+            value = self._projections[name] = projection(self)
+            return value
+
+    def thaw(self):
+        """Return a mutable deep copy, made of dicts, lists and sets."""
+        return thaw(self)
+
+
+def freeze(value):
+    if isinstance(value, Record):
+        return value
+    elif isinstance(value, collections.abc.Mapping):
+        return Record(value)
+    elif isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    elif isinstance(value, (set, frozenset)):
+        return frozenset(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    if isinstance(value, Record):
+        return {key: thaw(v) for key, v in value.items()}
+    elif isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    elif isinstance(value, frozenset):
+        return set(thaw(v) for v in value)
+    return value
+
+
+# hash => Record; equal records built later resolve to the same instance.
+_interned = weakref.WeakValueDictionary()
+
+
+def intern(data):
+    """Return a shared Record equal to data; kept while referenced elsewhere."""
+    record = data if isinstance(data, Record) else Record(data)
+    key = hash(record)
+    existing = _interned.get(key)
+    if existing is not None and existing == record:
+        return existing
+    # On a hash collision, the newest record wins.
+    _interned[key] = record
+    return record
+
+
+class RecordSource(DataSource):
+    """Wrap a DataSource, exposing its items as interned Records."""
+
+    def __init__(self, source, **kwargs):
+        super().__init__(**kwargs)
+        self.source = source
+
+    def _connect(self):
+        self.source._connect()
+
+    def _disconnect(self):
+        self.source._disconnect()
+
+    def all(self):
+        return {key: intern(item) for key, item in self.source.all().items()}
+
+    def get(self, key):
+        item = self.source.get(key)
+        return None if item is None else intern(item)
+
+    def __repr__(self):
+        return '<%s: %r>' % (self.__class__.__name__, self.source)
@@ -0,0 +1,90 @@
+import heapq
+
+from .datastructs import Action, Batch
+
+
+class BasePrioritizer:
+    """Score changes; lower scores are applied first.
+
+    Each distinct score splits steps into separate handler calls: scores
+    should come from a small set of values, e.g. one per kind of change.
+    Schedulers merge neighbouring scores beyond their ``priority_classes``.
+    """
+
+    def prioritize(self, change):
+        return 0
+
+
+class ActionPrioritizer(BasePrioritizer):
+    """Prioritize changes by action, e.g. to apply deletions first.
+
+    Args:
+        created, updated, deleted (int): the priority of each action
+    """
+
+    def __init__(self, *, created=0, updated=0, deleted=0):
+        self.priorities = {
+            Action.CREATED: created,
+            Action.UPDATED: updated,
+            Action.DELETED: deleted,
+        }
+
+    def prioritize(self, change):
+        return self.priorities[change.action]
+
+
+class Scheduler:
+    """Split steps into batches, and yield them by priority across all sinks.
+
+    Batches with the same priority are yielded in the order of their steps,
+    so that a constant prioritizer keeps the natural sink/action order.
+
+    Args:
+        prioritizer (BasePrioritizer): scores each change
+        priority_classes (int): the maximum number of batches per step; when
+            changes have more distinct scores, neighbouring scores are merged
+            into classes, and changes are ordered by score within a batch.
+    """
+
+    def __init__(self, prioritizer=None, *, priority_classes=8):
+        self.prioritizer = prioritizer or BasePrioritizer()
+        self.priority_classes = priority_classes
+
+    def schedule(self, steps):
+        scored = [
+            (step, [(self.prioritizer.prioritize(change), key, change) for key, change in step.changes.items()])
+            for step in steps
+        ]
+        classes = self._classes(set(
+            priority for _step, changes in scored for priority, _key, _change in changes
+        ))
+
+        queue = []
+        for index, (step, changes) in enumerate(scored):
+            by_priority = {}
+            for priority, key, change in sorted(changes, key=lambda scored_change: scored_change[0]):
+                by_priority.setdefault(classes[priority], {})[key] = change
+
+            for priority, changes in by_priority.items():
+                batch = Batch(
+                    priority=priority,
+                    sink=step.sink,
+                    action=step.action,
+                    handler=step.handler,
+                    changes=changes,
+                )
+                # (priority, index) is unique: batches are never compared.
+                heapq.heappush(queue, (priority, index, batch))
+
+        while queue:
+            _priority, _index, batch = heapq.heappop(queue)
+            yield batch
+
+    def _classes(self, priorities):
+        """Map each priority to its class: the lowest priority of its group."""
+        priorities = sorted(priorities)
+        size = -(-len(priorities) // self.priority_classes)  # Rounded up
+        return {
+            priority: priorities[rank - rank % size]
+            for rank, priority in enumerate(priorities)
+        }
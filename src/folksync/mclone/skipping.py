@@ -0,0 +1,62 @@
+import functools
+import re
+
+
+class SkipRules:
+    """Declarative rules describing which items a DataSink must skip.
+
+    Key-based rules are compiled once, and evaluated in bulk against all keys:
+    prefixes are merged into a single regular expression, and each pattern is
+    compiled on its own so that its groups and backreferences stay isolated.
+    Compiled expressions are cached across instances and runs.
+
+    Args:
+        keys (text iterable): exact keys to skip
+        prefixes (text iterable): skip keys starting with any of those
+        patterns (text iterable): skip keys fully matching any of those regexps
+        predicates (callable list): skip items for which any predicate is true;
+            called with the source item, or the sink item for a deletion.
+    """
+
+    def __init__(self, *, keys=(), prefixes=(), patterns=(), predicates=()):
+        self.keys = frozenset(keys)
+        self.prefixes = tuple(sorted(set(prefixes)))
+        self.patterns = tuple(patterns)
+        self.predicates = tuple(predicates)
+        self._prefix_regexp = _compile_prefixes(self.prefixes)
+        self._pattern_regexps = tuple(_compile_pattern(pattern) for pattern in self.patterns)
+
+    def skipped_keys(self, keys):
+        """Return the subset of keys skipped by key-based rules."""
+        skipped = set(self.keys.intersection(keys))
+        if self._prefix_regexp is not None:
+            skipped.update(filter(self._prefix_regexp.match, keys))
+        for regexp in self._pattern_regexps:
+            skipped.update(filter(regexp.fullmatch, keys))
+        return skipped
+
+    def skips_item(self, item):
+        return any(predicate(item) for predicate in self.predicates)
+
+    def __repr__(self):
+        return '<%s: keys=%r prefixes=%r patterns=%r predicates=%d>' % (
+            self.__class__.__name__,
+            sorted(self.keys),
+            self.prefixes,
+            self.patterns,
+            len(self.predicates),
+        )
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_prefixes(prefixes):
+    """Merge prefixes into a single regexp, for use with re.match."""
+    if not prefixes:
+        return None
+    return re.compile('|'.join(re.escape(prefix) for prefix in prefixes))
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_pattern(pattern):
+    """Compile a pattern as written, for use with re.fullmatch."""
+    return re.compile(pattern)
@@ -1,16 +1,48 @@
 import collections
 
-from .datastructs import Action, Change, ReplicationContext, ReplicationMode, ReplicationStepState
+from . import profiling
+from .datastructs import (
+    Action, Change, ReplicationContext, ReplicationMode, ReplicationStepState, SourceSnapshot, Step,
+)
+from .execution import BatchExecutor
+from .scheduling import Scheduler
+
+
+#: Modes in which each action is applied
+APPLY_MODES = {
+    Action.CREATED: [ReplicationMode.ADDITIVE, ReplicationMode.FULL],
+    Action.UPDATED: [ReplicationMode.ADDITIVE, ReplicationMode.FULL],
+    Action.DELETED: [ReplicationMode.FULL],
+}
+
+
+def take_snapshot(data):
+    """Wrap source data into a SourceSnapshot, computing its key set once."""
+    return SourceSnapshot(data=data, keys=frozenset(data))
 
 
 class Replicator:
-    def __init__(self, source, sinks, interactor):
+    def __init__(
+            self, source, sinks, interactor,
+            verifier=None, scheduler=None, profiler=None, executor=None):
         self.source = source
         self.sinks = sinks
         self.interactor = interactor
-
-    def replicate(self, mode, only_keys=()):
-        source_data = self.source.all()
+        self.verifier = verifier
+        self.scheduler = scheduler or Scheduler()
+        self.executor = executor or BatchExecutor()
+        self.profiler = profiler or profiling.from_environ() or profiling.NullProfiler()
+
+    def replicate(self, mode, only_keys=(), snapshot=None):
+        """Run a replication; snapshot is an optional, pre-fetched SourceSnapshot."""
+        try:
+            with self.profiler.section('replicate'):
+                return self._replicate(mode, only_keys=only_keys, snapshot=snapshot)
+        finally:
+            self.profiler.write()
+
+    def _replicate(self, mode, only_keys, snapshot):
+        snapshot = self._fetch_source(snapshot)
 
         # changes is a list of (sink, sink_changes) tuples
         # Where sink_changes is a dict(key => Change)
@@ -18,116 +50,171 @@ class Replicator:
         stats = {action: set() for action in Action}
 
         for sink in self.sinks:
-            sink_data = sink.all()
-            sink_changes = {action: {} for action in Action}
-
-            # Process all keys (local + remote)
-            base_keys = set(source_data.keys()) | set(sink_data.keys())
-            if only_keys:
-                keys = base_keys & set(only_keys)
-            else:
-                keys = base_keys
-            sink_skips = sink.get_skipped_keys(keys)
-
-            for key in keys:
-
-                source_item = source_data.get(key)
-                sink_item = sink_data.get(key)
-
-                # A source/sink may not provide empty items
-                assert source_item is not None or sink_item is not None
-                if key in sink_skips:
-                    change = Change(
-                        action=Action.SKIPPED,
-                        key=key,
-                        sink=sink,
-                        target=source_item,
-                        previous=None,
-                        delta=None,
-                    )
-                elif source_item is None:
-                    change = Change(
-                        action=Action.DELETED,
-                        key=key,
-                        sink=sink,
-                        target=source_item,
-                        previous=sink_item,
-                        delta=None,
-                    )
-                else:
-                    delta = sink.merge(sink_item, source_item)
-                    if sink_item is None:
-                        action = Action.CREATED
-                    elif delta:
-                        action = Action.UPDATED
-                    else:
-                        action = Action.UNCHANGED
-
-                    change = Change(
-                        action=action,
-                        key=key,
-                        sink=sink,
-                        target=source_item,
-                        previous=sink_item,
-                        delta=delta,
-                    )
-
-                sink_changes[change.action][key] = change
-                stats[change.action].add(key)
-                # End `for key in keys`
-
+            sink_changes = self._diff_sink(sink, snapshot, only_keys)
+            for action, action_changes in sink_changes.items():
+                stats[action].update(action_changes)
             changes[sink] = sink_changes
-            # End `for sink in self.sinks`
 
         context = ReplicationContext(
             source=self.source,
             sinks=self.sinks,
-            keys=set(source_data.keys()),
+            keys=snapshot.keys,
             changes=changes,
             stats={action: len(stats[action]) for action in Action},
+            divergences=collections.OrderedDict(),
+            failures=collections.OrderedDict(),
         )
 
-        self.interactor.notify_changes(context)
-        mode = self.interactor.choose_mode(context, mode)
-
-        for sink, sink_changes in changes.items():
-            created = sink_changes[Action.CREATED]
-            updated = sink_changes[Action.UPDATED]
-            deleted = sink_changes[Action.DELETED]
+        mode = self._choose_mode(context, mode)
 
-            self._run_step(
+        # Changes successfully sent to each sink: {sink => {action => {key => Change}}}
+        applied = collections.OrderedDict((sink, {}) for sink in changes)
+        steps = []
+        for sink in changes:
+            steps.extend(self._prepare_steps(
                 sink=sink,
-                action=Action.CREATED,
-                handler=sink.create_batch,
-                changes=created,
-                condition=mode in [ReplicationMode.ADDITIVE, ReplicationMode.FULL],
+                actions=[Action.CREATED, Action.UPDATED, Action.DELETED],
+                mode=mode,
                 context=context,
-            )
-
-            self._run_step(
-                sink=sink,
-                action=Action.UPDATED,
-                handler=sink.update_batch,
-                changes=updated,
-                condition=mode in [ReplicationMode.ADDITIVE, ReplicationMode.FULL],
-                context=context,
-            )
-
-            self._run_step(
-                sink=sink,
-                action=Action.DELETED,
-                handler=sink.delete_batch,
-                changes=deleted,
-                condition=mode in [ReplicationMode.FULL],
-                context=context,
-            )
-
-    def _run_step(self, sink, action, handler, changes, condition, context):
-        if not changes:
-            self.interactor.notify_step(sink, action, ReplicationStepState.EMPTY, context)
-        elif not condition:
-            self.interactor.notify_step(sink, action, ReplicationStepState.SKIPPED, context)
+            ))
+        self._apply(steps, context, applied)
+        self._verify(context, applied)
+
+        return context
+
+    def _fetch_source(self, snapshot=None):
+        if snapshot is not None:
+            return snapshot
+        with self.profiler.section('source', 'all'):
+            return take_snapshot(self.source.all())
+
+    def _choose_mode(self, context, mode):
+        with self.profiler.section('decide'):
+            self.interactor.notify_changes(context)
+            return self.interactor.choose_mode(context, mode)
+
+    def _diff_sink(self, sink, snapshot, only_keys):
+        """Compute the {action => {key => Change}} required for a sink."""
+        with self.profiler.section(sink, 'diff'):
+            return self._diff_sink_data(sink, snapshot, only_keys)
+
+    def _diff_sink_data(self, sink, snapshot, only_keys):
+        source_data = snapshot.data
+        sink_data = sink.all()
+        sink_changes = {action: {} for action in Action}
+
+        # Process all keys (local + remote)
+        base_keys = snapshot.keys.union(sink_data.keys())
+        if only_keys:
+            keys = base_keys & set(only_keys)
         else:
-            self.interactor.notify_step(sink, action, ReplicationStepState.START, context)
-            handler(changes)
-            self.interactor.notify_step(sink, action, ReplicationStepState.SUCCESS, context)
+            keys = base_keys
+        sink_skips = sink.get_skipped_keys(keys)
+        skip_item = None
+        rules = sink.get_skip_rules()
+        if rules is not None:
+            sink_skips = sink_skips | rules.skipped_keys(keys)
+            if rules.predicates:
+                skip_item = rules.skips_item
+
+        for key in keys:
+
+            source_item = source_data.get(key)
+            sink_item = sink_data.get(key)
+
+            # A source/sink may not provide empty items
+            assert source_item is not None or sink_item is not None
+            if key in sink_skips or (
+                    skip_item is not None
+                    and skip_item(sink_item if source_item is None else source_item)):
+                change = Change(
+                    action=Action.SKIPPED,
+                    key=key,
+                    sink=sink,
+                    target=source_item,
+                    previous=None,
+                    delta=None,
+                )
+            elif source_item is None:
+                change = Change(
+                    action=Action.DELETED,
+                    key=key,
+                    sink=sink,
+                    target=source_item,
+                    previous=sink_item,
+                    delta=None,
+                )
+            else:
+                delta = sink.merge(sink_item, source_item)
+                if sink_item is None:
+                    action = Action.CREATED
+                elif delta:
+                    action = Action.UPDATED
+                else:
+                    action = Action.UNCHANGED
+
+                change = Change(
+                    action=action,
+                    key=key,
+                    sink=sink,
+                    target=source_item,
+                    previous=sink_item,
+                    delta=delta,
+                )
+
+            sink_changes[change.action][key] = change
+            # End `for key in keys`
+
+        return sink_changes
+
+    def _prepare_steps(self, sink, actions, mode, context):
+        """Notify empty/disabled steps, and return the ones to run."""
+        handlers = {
+            Action.CREATED: sink.create_batch,
+            Action.UPDATED: sink.update_batch,
+            Action.DELETED: sink.delete_batch,
+        }
+        steps = []
+        for action in actions:
+            changes = context.changes[sink][action]
+            if not changes:
+                self.interactor.notify_step(sink, action, ReplicationStepState.EMPTY, context)
+            elif mode not in APPLY_MODES[action]:
+                self.interactor.notify_step(sink, action, ReplicationStepState.SKIPPED, context)
+            else:
+                steps.append(Step(
+                    sink=sink,
+                    action=action,
+                    handler=handlers[action],
+                    changes=changes,
+                ))
+        return steps
+
+    def _apply(self, steps, context, applied):
+        for batch in self.scheduler.schedule(steps):
+            self._run_batch(batch, context, applied[batch.sink])
+
+    def _verify(self, context, applied):
+        if self.verifier is not None:
+            with self.profiler.section('verify'):
+                context.divergences.update(self.verifier.verify(context, applied))
+                self.interactor.notify_divergences(context)
+
+    def _run_batch(self, batch, context, applied):
+        with self.profiler.section(batch.sink, batch.action.name):
+            with self.profiler.section('notify'):
+                self.interactor.notify_step(
+                    batch.sink, batch.action, ReplicationStepState.START, context, changes=batch.changes,
+                )
+            with self.profiler.section('apply'):
+                failures = self.executor.execute(batch, self.interactor)
+            applied.setdefault(batch.action, {}).update(
+                (key, change) for key, change in batch.changes.items() if key not in failures
+            )
+            if failures:
+                context.failures.setdefault(batch.sink, {}).setdefault(batch.action, {}).update(failures)
+                state = ReplicationStepState.PARTIAL
+            else:
+                state = ReplicationStepState.SUCCESS
+            with self.profiler.section('notify'):
+                self.interactor.notify_step(batch.sink, batch.action, state, context, changes=batch.changes)
@@ -0,0 +1,77 @@
+import collections
+import concurrent.futures
+
+from . import profiling
+from .syncer import Replicator, take_snapshot
+
+
+#: TenantResult: the outcome of a tenant's replication
+#: Attributes:
+#:  - tenant (Tenant): the tenant
+#:  - context (ReplicationContext): the run's context; None if it failed
+#:  - error (Exception): the error aborting the run, if any
+TenantResult = collections.namedtuple('TenantResult', ['tenant', 'context', 'error'])
+
+
+class MultiTenantRunner:
+    """Replicate one source to many tenants, fetching the source only once.
+
+    The source is fetched and indexed once per run; each tenant is then
+    replicated by its own Replicator, with its own interactor and decider.
+    At most ``workers`` tenants run at the same time, and tenants are started
+    in order: a slow tenant holds a single worker, and cannot starve others.
+    A failing tenant does not affect the others.
+
+    All tenants share a single profiler: each run is tagged with the tenant's
+    name, and results are written once all tenants have finished.
+
+    Args:
+        source (DataSource): the shared source
+        tenants (Tenant list): the tenants to replicate
+        workers (int): the global number of concurrent tenant runs
+        replicator_class (Replicator subclass): the replicator for each tenant
+        profiler: the shared profiler; defaults to one enabled through FOLKSYNC_PROFILE
+        replicator_options: extra arguments for each tenant's replicator
+    """
+
+    def __init__(
+            self, source, tenants, *,
+            workers=4, replicator_class=Replicator, profiler=None, **replicator_options):
+        self.source = source
+        self.tenants = tenants
+        self.workers = workers
+        self.replicator_class = replicator_class
+        self.profiler = profiler or profiling.from_environ() or profiling.NullProfiler()
+        self.replicator_options = replicator_options
+
+    def replicate(self, mode, only_keys=()):
+        """Replicate all tenants; returns a {tenant name => TenantResult} dict."""
+        try:
+            with self.profiler.section('source', 'all'):
+                snapshot = take_snapshot(self.source.all())
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = collections.OrderedDict(
+                    (tenant.name, executor.submit(self._replicate_tenant, tenant, mode, only_keys, snapshot))
+                    for tenant in self.tenants
+                )
+                return collections.OrderedDict(
+                    (name, future.result()) for name, future in futures.items()
+                )
+        finally:
+            self.profiler.write()
+
+    def _replicate_tenant(self, tenant, mode, only_keys, snapshot):
+        replicator = self.replicator_class(
+            source=self.source,
+            sinks=tenant.sinks,
+            interactor=tenant.interactor,
+            profiler=profiling.SharedProfiler(self.profiler),
+            **self.replicator_options
+        )
+        try:
+            with self.profiler.section(tenant.name):
+                context = replicator.replicate(mode, only_keys=only_keys, snapshot=snapshot)
+        except Exception as e:
+            return TenantResult(tenant=tenant, context=None, error=e)
+        return TenantResult(tenant=tenant, context=context, error=None)
@@ -0,0 +1,97 @@
+import collections
+import math
+import random
+
+from .datastructs import Action, Change
+
+
+class BaseVerifier:
+    """Re-read applied changes from their sink, and report divergent items.
+
+    Items are fetched one by one through ``DataSink.get()``, and compared
+    against their expected value with ``DataSink.merge()``.
+    """
+
+    def select(self, keys):
+        return sorted(keys)
+
+    def verify(self, context, applied):
+        """Check applied changes.
+
+        Args:
+            context (ReplicationContext): the current replication run
+            applied ({DataSink: {Action: {key: Change}}}): changes that
+                were successfully sent to each sink
+
+        Returns:
+            {DataSink: {Action: {key: Change}}}: the changes required to
+            bring divergent items back in line; only non-empty sinks are listed.
+        """
+        divergences = collections.OrderedDict()
+        for sink, sink_applied in applied.items():
+            sink_changes = {action: {} for action in Action}
+            pending = {}
+            for action_changes in sink_applied.values():
+                pending.update(action_changes)
+
+            for key in self.select(pending):
+                change = self.check(sink, pending[key])
+                if change is not None:
+                    sink_changes[change.action][key] = change
+
+            if any(sink_changes.values()):
+                divergences[sink] = sink_changes
+        return divergences
+
+    def check(self, sink, change):
+        current = sink.get(change.key)
+
+        if change.action == Action.DELETED:
+            if current is None:
+                return None
+            return Change(
+                action=Action.DELETED,
+                key=change.key,
+                sink=sink,
+                target=None,
+                previous=current,
+                delta=None,
+            )
+
+        delta = sink.merge(current, change.target)
+        if current is None:
+            action = Action.CREATED
+        elif delta:
+            action = Action.UPDATED
+        else:
+            return None
+        return Change(
+            action=action,
+            key=change.key,
+            sink=sink,
+            target=change.target,
+            previous=current,
+            delta=delta,
+        )
+
+
+class SampledVerifier(BaseVerifier):
+    """Only check a random sample of each sink's applied changes.
+
+    Args:
+        ratio (float): share of the applied keys to check, in [0, 1]
+        minimum (int): check at least that many keys per sink, if available
+        seed: optional seed for reproducible samples
+    """
+
+    def __init__(self, *, ratio=0.1, minimum=1, seed=None):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.random = random.Random(seed)
+
+    def select(self, keys):
+        keys = sorted(keys)
+        size = max(self.minimum, int(math.ceil(len(keys) * self.ratio)))
+        if size >= len(keys):
+            return keys
+        return sorted(self.random.sample(keys, size))
@@ -1,10 +1,15 @@
+import collections
 import factory
 import io
 
 from folksync.mclone import base
 from folksync.mclone import datastructs
 from folksync.mclone import interaction
+from folksync.mclone import multi
+from folksync.mclone import pipeline
+from folksync.mclone import scheduling
 from folksync.mclone import syncer
+from folksync.mclone import verification
 
 
 class DictSource(base.DataSource):
@@ -19,8 +24,11 @@ class DictSource(base.DataSource):
 
 
 class DictSink(base.DataSink):
-    def __init__(self, initial, name, skipped=()):
+    def __init__(self, initial, name, skipped=(), journal=None, skip_rules=None):
         self.initial = initial
+        self.skip_rules = skip_rules
+        # Shared log of (name, action, keys) batches, to check ordering across sinks
+        self.journal = journal if journal is not None else []
         self.created = {}
         self.updated = {}
         self.deleted = []
@@ -30,6 +38,9 @@ class DictSink(base.DataSink):
     def get_skipped_keys(self, all_keys):
         return set(key for key in self.skipped if key in all_keys)
 
+    def get_skip_rules(self):
+        return self.skip_rules
+
     def all(self):
         base = dict(self.initial)
         base.update(self.created)
@@ -38,6 +49,9 @@ class DictSink(base.DataSink):
             base.pop(k)
         return base
 
+    def get(self, key):
+        return self.all().get(key)
+
     def merge(self, base, updated):
         if base == updated:
             return None
@@ -45,17 +59,20 @@ class DictSink(base.DataSink):
             return (base, updated)
 
     def create_batch(self, changes):
+        self.journal.append((self.name, 'create', sorted(changes)))
         for c in changes.values():
             assert c.key not in self.initial
             self.created[c.key] = c.target
 
     def update_batch(self, changes):
+        self.journal.append((self.name, 'update', sorted(changes)))
         for c in changes.values():
             assert self.initial[c.key] == c.previous
             assert c.key not in self.created
             self.updated[c.key] = c.target
 
     def delete_batch(self, changes):
+        self.journal.append((self.name, 'delete', sorted(changes)))
         for c in changes.values():
             assert c.key in self.initial
             assert c.key not in self.deleted
@@ -73,6 +90,60 @@ class DictSink(base.DataSink):
         )
 
 
+class LossyDictSink(DictSink):
+    """A DictSink silently dropping writes to some keys."""
+    def __init__(self, initial, name, skipped=(), journal=None, skip_rules=None, lost=()):
+        super().__init__(initial, name, skipped=skipped, journal=journal, skip_rules=skip_rules)
+        self.lost = lost
+
+    def create_batch(self, changes):
+        super().create_batch({k: c for k, c in changes.items() if k not in self.lost})
+
+    def update_batch(self, changes):
+        super().update_batch({k: c for k, c in changes.items() if k not in self.lost})
+
+    def delete_batch(self, changes):
+        super().delete_batch({k: c for k, c in changes.items() if k not in self.lost})
+
+
+class RejectingDictSink(DictSink):
+    """A DictSink rejecting whole batches containing some keys."""
+    def __init__(self, initial, name, skipped=(), journal=None, skip_rules=None, rejected=()):
+        super().__init__(initial, name, skipped=skipped, journal=journal, skip_rules=skip_rules)
+        self.rejected = rejected
+        self.calls = 0
+
+    def _check(self, changes):
+        self.calls += 1
+        bad = sorted(key for key in changes if key in self.rejected)
+        if bad:
+            raise ValueError("Rejected keys: %s" % ', '.join(bad))
+
+    def create_batch(self, changes):
+        self._check(changes)
+        super().create_batch(changes)
+
+    def update_batch(self, changes):
+        self._check(changes)
+        super().update_batch(changes)
+
+    def delete_batch(self, changes):
+        self._check(changes)
+        super().delete_batch(changes)
+
+
+class DictMultiSink(base.MultiDataSink):
+    def __init__(self, sinks, dependencies=None):
+        self.sinks = sinks
+        self.deps = dependencies or {}
+
+    def collections(self):
+        return collections.OrderedDict(sorted(self.sinks.items()))
+
+    def dependencies(self):
+        return self.deps
+
+
 class ThresholDeciderFactory(factory.Factory):
     class Meta:
         model = interaction.ThresholdDecider
@@ -97,6 +168,21 @@ class InteractorFactory(factory.Factory):
         model = interaction.BaseInteractor
 
 
+class SampledVerifierFactory(factory.Factory):
+    class Meta:
+        model = verification.SampledVerifier
+
+    ratio = 1.0
+    seed = 42
+
+
+class SchedulerFactory(factory.Factory):
+    class Meta:
+        model = scheduling.Scheduler
+
+    prioritizer = None
+
+
 class DictSourceFactory(factory.Factory):
     class Meta:
         model = DictSource
@@ -112,6 +198,16 @@ class DictSinkFactory(factory.Factory):
     name = factory.Sequence(lambda i: 'sink%s' % i)
 
 
+class LossyDictSinkFactory(DictSinkFactory):
+    class Meta:
+        model = LossyDictSink
+
+
+class RejectingDictSinkFactory(DictSinkFactory):
+    class Meta:
+        model = RejectingDictSink
+
+
 class ReplicatorFactory(factory.Factory):
     class Meta:
         model = syncer.Replicator
@@ -129,3 +225,17 @@ class ReplicatorFactory(factory.Factory):
         ]
         kwargs['sinks'] = sinks
         return kwargs
+
+
+class MultiReplicatorFactory(factory.Factory):
+    class Meta:
+        model = multi.MultiReplicator
+
+    source = factory.SubFactory(DictSourceFactory)
+    interactor = factory.SubFactory(InteractorFactory)
+    sinks = factory.List([])
+
+
+class PipelinedReplicatorFactory(ReplicatorFactory):
+    class Meta:
+        model = pipeline.PipelinedReplicator
@@ -1,10 +1,26 @@
+import io
 import logging
+import os
+import re
+import tempfile
+import threading
+import time
 import unittest
 
 from folksync.mclone import base
 from folksync.mclone import datastructs
+from folksync.mclone import emulation
+from folksync.mclone import execution
 from folksync.mclone import interaction
+from folksync.mclone import loadtest
+from folksync.mclone import mapping
+from folksync.mclone import multi
+from folksync.mclone import profiling
+from folksync.mclone import records
+from folksync.mclone import scheduling
+from folksync.mclone import skipping
 from folksync.mclone import syncer
+from folksync.mclone import tenants
 
 from . import factories
 
@@ -353,3 +369,845 @@ class SyncTest(unittest.TestCase):
         self.assertEqual({}, sink1.created)
         self.assertEqual({}, sink1.updated)
         self.assertEqual([], sink1.deleted)
+
+
+class VerificationTest(unittest.TestCase):
+    def test_no_verifier(self):
+        repl = factories.ReplicatorFactory(
+            source__data={'a': 1, 'b': 2},
+            sink0=factories.LossyDictSinkFactory(lost=['a']),
+        )
+        context = repl.replicate(datastructs.ReplicationMode.FULL)
+        self.assertEqual({}, context.divergences)
+
+    def test_all_converged(self):
+        repl = factories.ReplicatorFactory(
+            source__data={'a': 1, 'b': 2},
+            sink0__initial={'b': 3, 'c': 4},
+            verifier=factories.SampledVerifierFactory(),
+        )
+        context = repl.replicate(datastructs.ReplicationMode.FULL)
+        self.assertEqual({}, context.divergences)
+
+    def test_divergent(self):
+        sink0 = factories.LossyDictSinkFactory(
+            initial={'b': 3, 'c': 4},
+            lost=['a', 'b', 'c'],
+        )
+        repl = factories.ReplicatorFactory(
+            source__data={'a': 1, 'b': 2},
+            sink0=sink0,
+            verifier=factories.SampledVerifierFactory(),
+        )
+        context = repl.replicate(datastructs.ReplicationMode.FULL)
+        self.assertEqual([sink0], list(context.divergences))
+        divergences = context.divergences[sink0]
+        self.assertEqual(['a'], list(divergences[datastructs.Action.CREATED]))
+        self.assertEqual(['b'], list(divergences[datastructs.Action.UPDATED]))
+        self.assertEqual(3, divergences[datastructs.Action.UPDATED]['b'].previous)
+        self.assertEqual(['c'], list(divergences[datastructs.Action.DELETED]))
+
+    def test_dry_run(self):
+        repl = factories.ReplicatorFactory(
+            source__data={'a': 1},
+            sink0=factories.LossyDictSinkFactory(lost=['a']),
+            verifier=factories.SampledVerifierFactory(),
+        )
+        context = repl.replicate(datastructs.ReplicationMode.DRY_RUN)
+        # Nothing was applied, thus nothing to check.
+        self.assertEqual({}, context.divergences)
+
+    def test_sampled(self):
+        sink0 = factories.LossyDictSinkFactory(lost=list('abcdefghij'))
+        repl = factories.ReplicatorFactory(
+            source__data={k: 1 for k in 'abcdefghij'},
+            sink0=sink0,
+            verifier=factories.SampledVerifierFactory(ratio=0.3),
+        )
+        context = repl.replicate(datastructs.ReplicationMode.FULL)
+        self.assertEqual(3, len(context.divergences[sink0][datastructs.Action.CREATED]))
+
+
+class PriorityTest(unittest.TestCase):
+    def _journal(self, **kwargs):
+        journal = []
+        repl = factories.ReplicatorFactory(
+            source__data={'a': 1, 'b': 2},
+            sink0__initial={'b': 3, 'c': 4},
+            sink0__journal=journal,
+            sink0__name='s0',
+            sink1__initial={'a': 2, 'd': 5},
+            sink1__name='s1',
+            sink1__journal=journal,
+            **kwargs
+        )
+        repl.replicate(datastructs.ReplicationMode.FULL)
+        return journal
+
+    def test_default_order(self):
+        self.assertEqual(
+            [
+                ('s0', 'create', ['a']),
+                ('s0', 'update', ['b']),
+                ('s0', 'delete', ['c']),
+                ('s1', 'create', ['b']),
+                ('s1', 'update', ['a']),
+                ('s1', 'delete', ['d']),
+            ],
+            self._journal(),
+        )
+
+    def test_deletions_first(self):
+        journal = self._journal(
+            scheduler=factories.SchedulerFactory(
+                prioritizer=scheduling.ActionPrioritizer(deleted=-1),
+            ),
+        )
+        self.assertEqual(
+            [
+                ('s0', 'delete', ['c']),
+                ('s1', 'delete', ['d']),
+                ('s0', 'create', ['a']),
+                ('s0', 'update', ['b']),
+                ('s1', 'create', ['b']),
+                ('s1', 'update', ['a']),
+            ],
+            journal,
+        )
+
+    def test_split_step(self):
+        class KeyPrioritizer(scheduling.BasePrioritizer):
+            def prioritize(self, change):
+                return 0 if change.key == 'y' else 1
+
+        journal = []
+        repl = factories.ReplicatorFactory(
+            source__data={'x': 1, 'y': 2},
+            sink0__journal=journal,
+            sink1__journal=journal,
+            scheduler=factories.SchedulerFactory(prioritizer=KeyPrioritizer()),
+        )
+        repl.replicate(datastructs.ReplicationMode.FULL)
+        self.assertEqual(
+            [['y'], ['y'], ['x'], ['x']],
+            [keys for _name, _action, keys in journal],
+        )
+
+
+    def test_bounded_batches(self):
+        class ScorePrioritizer(scheduling.BasePrioritizer):
+            def prioritize(self, change):
+                return change.target
+
+        journal = []
+        repl = factories.ReplicatorFactory(
+            source__data={'k%03d' % i: i for i in range(100)},
+            sink0__journal=journal,
+            sink1__journal=journal,
+            scheduler=factories.SchedulerFactory(prioritizer=ScorePrioritizer(), priority_classes=4),
+        )
+        repl.replicate(datastructs.ReplicationMode.FULL)
+        self.assertEqual(8, len(journal))
+        self.assertEqual(['k%03d' % i for i in range(25)], journal[0][2])
+        self.assertEqual(journal[0][2], journal[1][2])
+        self.assertEqual(['k%03d' % i for i in range(75, 100)], journal[-1][2])
+
+class MultiCollectionTest(unittest.TestCase):
+    def _multi_sink(self, journal, initial=None, **kwargs):
+        initial = initial or {}
+        return factories.DictMultiSink(
+            sinks={
+                name: factories.DictSinkFactory(
+                    name=name,
+                    initial=initial.get(name, {}),
+                    journal=journal,
+                )
+                for name in ['users', 'groups', 'memberships']
+            },
+            dependencies={'memberships': ['users', 'groups']},
+            **kwargs
+        )
+
+    def test_waves(self):
+        self.assertEqual(
+            [['a', 'b'], ['c'], ['d']],
+            multi.dependency_waves('abcd', {'c': ['a', 'b'], 'd': ['c']}),
+        )
+
+    def test_waves_unknown(self):
+        with self.assertRaises(ValueError):
+            multi.dependency_waves('ab', {'b': ['c']})
+
+    def test_waves_circular(self):
+        with self.assertRaises(ValueError):
+            multi.dependency_waves('abc', {'a': ['b'], 'b': ['a'], 'c': ['a']})
+
+    def test_dependency_order(self):
+        journal = []
+        multi_sink = self._multi_sink(journal, initial={
+            'users': {'bob': 2},
+            'memberships': {'bob:staff': 1},
+        })
+        repl = factories.MultiReplicatorFactory(
+            source__data={
+                'users': {'alice': 1},
+                'groups': {'staff': 1},
+                'memberships': {'alice:staff': 1},
+            },
+            sinks=[multi_sink],
+            workers=2,
+        )
+        context = repl.replicate(datastructs.ReplicationMode.FULL)
+
+        # Users and groups share a wave: their relative order is undefined.
+        self.assertEqual(
+            [('groups', 'create', ['staff']), ('users', 'create', ['alice'])],
+            sorted(journal[:2]),
+        )
+        self.assertEqual(
+            [
+                ('memberships', 'create', ['alice:staff']),
+                ('memberships', 'delete', ['bob:staff']),
+                ('users', 'delete', ['bob']),
+            ],
+            journal[2:],
+        )
+        self.assertEqual(
+            {('users', 'alice'), ('groups', 'staff'), ('memberships', 'alice:staff')},
+            context.keys,
+        )
+        self.assertEqual(3, context.stats[datastructs.Action.CREATED])
+
+    def test_threshold(self):
+        journal = []
+        repl = factories.MultiReplicatorFactory(
+            source__data={'users': {'alice': 1}},
+            sinks=[self._multi_sink(journal)],
+            interactor__decider=factories.ThresholDeciderFactory(),
+        )
+        repl.replicate(datastructs.ReplicationMode.ADDITIVE)
+        self.assertEqual([], journal)
+
+
+class ProfilingTest(unittest.TestCase):
+    def test_from_environ(self):
+        self.assertIsNone(profiling.from_environ({}))
+        profiler = profiling.from_environ({profiling.ENV_VAR: '/tmp/profile'}, top=5)
+        self.assertEqual('/tmp/profile', profiler.output_dir)
+        self.assertEqual(5, profiler.top)
+
+    def test_profile_run(self):
+        class SlowSink(factories.DictSink):
+            def create_batch(self, changes):
+                time.sleep(0.05)
+                super().create_batch(changes)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            profiler = profiling.SamplingProfiler(output_dir, interval=0.001)
+            repl = factories.ReplicatorFactory(
+                source__data={'a': 1},
+                sink0=SlowSink(initial={}, name='slow'),
+                profiler=profiler,
+            )
+            repl.replicate(datastructs.ReplicationMode.FULL)
+
+            with open(os.path.join(output_dir, profiling.COLLAPSED_FILENAME)) as f:
+                stacks = [line.rsplit(' ', 1)[0] for line in f]
+            with open(os.path.join(output_dir, profiling.SUMMARY_FILENAME)) as f:
+                summary = f.read()
+
+        slow_stacks = [s for s in stacks if s.startswith('replicate;<SlowSink: slow>;CREATED;apply;')]
+        self.assertTrue(slow_stacks)
+        self.assertTrue(any('create_batch (test_mclone.py:' in s for s in slow_stacks))
+        self.assertIn('self%', summary)
+
+    def test_reused_replicator(self):
+        class SlowSink(factories.DictSink):
+            def create_batch(self, changes):
+                time.sleep(0.05)
+                super().create_batch(changes)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            profiler = profiling.SamplingProfiler(output_dir, interval=0.001)
+            repl = factories.ReplicatorFactory(
+                source__data={'a': 1},
+                sink0=SlowSink(initial={}, name='slow'),
+                profiler=profiler,
+            )
+            collapsed_path = os.path.join(output_dir, profiling.COLLAPSED_FILENAME)
+
+            repl.replicate(datastructs.ReplicationMode.FULL)
+            with open(collapsed_path) as f:
+                self.assertIn(';CREATED;', f.read())
+            self.assertEqual({}, dict(profiler.samples))
+
+            # Nothing left to create: the first run's samples must not remain.
+            repl.replicate(datastructs.ReplicationMode.FULL)
+            with open(collapsed_path) as f:
+                self.assertNotIn(';CREATED;', f.read())
+
+
+class SkipRulesTest(unittest.TestCase):
+    def test_key_rules(self):
+        rules = skipping.SkipRules(
+            keys=['root'],
+            prefixes=['bot-', 'svc.'],
+            patterns=[r'admin\d+'],
+        )
+        self.assertEqual(
+            {'root', 'bot-ci', 'svc.mail', 'admin42'},
+            rules.skipped_keys({'root', 'bot-ci', 'svc.mail', 'svcxmail', 'admin42', 'admin42x', 'alice'}),
+        )
+
+    def test_compile_cache(self):
+        rules1 = skipping.SkipRules(prefixes=['bot-', 'svc-'])
+        rules2 = skipping.SkipRules(prefixes=['svc-', 'bot-'])
+        self.assertIs(rules1._prefix_regexp, rules2._prefix_regexp)
+        rules3 = skipping.SkipRules(patterns=[r'admin\d+'])
+        rules4 = skipping.SkipRules(patterns=[r'admin\d+'])
+        self.assertIs(rules3._pattern_regexps[0], rules4._pattern_regexps[0])
+
+    def test_grouped_patterns(self):
+        rules = skipping.SkipRules(patterns=[r'(a)\1', r'(b)\1', r'(?P<x>c)(?P=x)', r'(?P<x>d)(?P=x)'])
+        self.assertEqual(
+            {'aa', 'bb', 'cc', 'dd'},
+            rules.skipped_keys({'aa', 'bb', 'cc', 'dd', 'ab', 'cd', 'aab'}),
+        )
+
+    def test_flagged_patterns(self):
+        rules = skipping.SkipRules(patterns=[r'(?i)bot-.*', r'(?x) admin \d+  # numbered admins'])
+        self.assertEqual(
+            {'BOT-ci', 'bot-x', 'admin42'},
+            rules.skipped_keys({'BOT-ci', 'bot-x', 'robot-x', 'admin42', 'admin42x'}),
+        )
+
+    def test_invalid_pattern(self):
+        with self.assertRaises(re.error):
+            skipping.SkipRules(patterns=['admin(', 'bot'])
+
+    def test_replicate(self):
+        rules = skipping.SkipRules(
+            prefixes=['bot-'],
+            predicates=[lambda item: item == 42],
+        )
+        sinks = factories.ReplicatorFactory(
+            source__data={'a': 1, 'bot-x': 2, 'c': 42},
+            sink0__initial={'bot-y': 3, 'd': 42, 'e': 5},
+            sink0__skip_rules=rules,
+        ).replicate(datastructs.ReplicationMode.FULL).sinks
+        sink0, sink1 = sinks
+        self.assertEqual({'a': 1}, sink0.created)
+        self.assertEqual(['e'], sink0.deleted)
+        self.assertEqual({'a': 1, 'bot-x': 2, 'c': 42}, sink1.created)
+
+
+class BisectingExecutorTest(unittest.TestCase):
+    def test_default_raises(self):
+        repl = factories.ReplicatorFactory(
+            source__data={'a': 1, 'b': 2},
+            sink0=factories.RejectingDictSinkFactory(rejected=['a']),
+        )
+        with self.assertRaises(ValueError):
+            repl.replicate(datastructs.ReplicationMode.FULL)
+
+    def test_isolate(self):
+        sink0 = factories.RejectingDictSinkFactory(
+            initial={'x': 0, 'y': 0},
+            rejected=['k', 'y'],
+        )
+        repl = factories.ReplicatorFactory(
+            source__data={key: 1 for key in 'abcdefghijklmnop'},
+            sink0=sink0,
+            executor=execution.BisectingExecutor(),
+        )
+        context = repl.replicate(datastructs.ReplicationMode.FULL)
+
+        created = {key: 1 for key in 'abcdefghijklmnop' if key != 'k'}
+        self.assertEqual(created, sink0.created)
+        self.assertEqual(['x'], sink0.deleted)
+        # The second sink is still handled
+        self.assertEqual({key: 1 for key in 'abcdefghijklmnop'}, repl.sinks[1].created)
+
+        self.assertEqual([sink0], list(context.failures))
+        failures = context.failures[sink0]
+        self.assertEqual(['k'], list(failures[datastructs.Action.CREATED]))
+        self.assertIsInstance(failures[datastructs.Action.CREATED]['k'], ValueError)
+        self.assertEqual(['y'], list(failures[datastructs.Action.DELETED]))
+        # 1 + 2 * log2(16) calls to isolate 'k'; 3 for 'x' and 'y'
+        self.assertEqual(9 + 3, sink0.calls)
+
+    def test_unexpected_error(self):
+        repl = factories.ReplicatorFactory(
+            source__data={'a': 1},
+            sink0=factories.RejectingDictSinkFactory(rejected=['a']),
+            executor=execution.BisectingExecutor(exceptions=(KeyError,)),
+        )
+        with self.assertRaises(ValueError):
+            repl.replicate(datastructs.ReplicationMode.FULL)
+
+
+class EmulationTest(unittest.TestCase):
+    def test_pagination(self):
+        service = emulation.EmulatedService({'k%02d' % i: i for i in range(25)}, page_size=10)
+        sink = emulation.EmulatedSink(service)
+        self.assertEqual({'k%02d' % i: i for i in range(25)}, sink.all())
+        self.assertEqual(3, service.stats['list'])
+
+    def test_batch_size(self):
+        service = emulation.EmulatedService(max_batch_size=4)
+        repl = factories.ReplicatorFactory(
+            source__data={key: 1 for key in 'abcdefghij'},
+            sink0=emulation.EmulatedSink(service),
+            sink1=emulation.EmulatedSink(emulation.EmulatedService(), batch_size=2),
+        )
+        repl.replicate(datastructs.ReplicationMode.FULL)
+        self.assertEqual({key: 1 for key in 'abcdefghij'}, service.items)
+        self.assertEqual(3, service.stats['create'])
+        self.assertEqual(5, repl.sinks[1].service.stats['create'])
+
+    def test_rate_limit(self):
+        service = emulation.EmulatedService({'a': 1}, rate=1000, burst=1)
+        sink = emulation.EmulatedSink(service)
+        for _i in range(5):
+            self.assertEqual(1, sink.get('a'))
+        self.assertGreaterEqual(service.stats['requests'], 5)
+        self.assertEqual(service.stats['requests'] - 5, service.stats['throttled'])
+
+    def test_transient_errors(self):
+        service = emulation.EmulatedService({'a': 1}, error_rate=0.5, seed=1)
+        sink = emulation.EmulatedSink(service, retries=20, backoff=0)
+        for _i in range(5):
+            self.assertEqual(1, sink.get('a'))
+        self.assertGreater(service.stats['errors'], 0)
+
+    def test_rejected(self):
+        result = loadtest.run(
+            items=200,
+            sinks=2,
+            rejected=['stale000001'],
+            executor=execution.BisectingExecutor(exceptions=(emulation.RejectedItems,)),
+        )
+        context = result['context']
+        failed = set()
+        for sink_failures in context.failures.values():
+            for action_failures in sink_failures.values():
+                failed.update(action_failures)
+        self.assertEqual({'stale000001'}, failed)
+
+    def test_update_missing(self):
+        service = emulation.EmulatedService({'a': 1})
+        with self.assertRaises(emulation.RejectedItems) as cm:
+            service.update({'a': 2, 'b': 3})
+        self.assertEqual({'b'}, cm.exception.keys)
+        self.assertEqual({'a': 1}, service.items)
+        service.update({'a': 2})
+        self.assertEqual(({'a': 2}, None), service.list())
+
+    def test_loadtest_main(self):
+        out = io.StringIO()
+        loadtest.main(['--items', '300', '--sinks', '3', '--error-rate', '0.05'], stdout=out)
+        self.assertIn("Replicated 300 items to 3 sinks", out.getvalue())
+
+
+class PipelineTest(unittest.TestCase):
+    def test_apply_while_fetching(self):
+        fast_done = threading.Event()
+
+        class FastSink(factories.DictSink):
+            def create_batch(self, changes):
+                super().create_batch(changes)
+                fast_done.set()
+
+        class SlowSink(factories.DictSink):
+            def all(self):
+                # Only returns once the fast sink has been written to.
+                self.fetched_after_apply = fast_done.wait(5)
+                return super().all()
+
+        slow = SlowSink(initial={}, name='slow')
+        fast = FastSink(initial={}, name='fast')
+        repl = factories.PipelinedReplicatorFactory(
+            source__data={'a': 1},
+            sink0=slow,
+            sink1=fast,
+        )
+        context = repl.replicate(datastructs.ReplicationMode.FULL)
+        self.assertTrue(slow.fetched_after_apply)
+        self.assertEqual({'a': 1}, slow.created)
+        self.assertEqual({'a': 1}, fast.created)
+        self.assertEqual({slow, fast}, set(context.changes))
+
+    def test_global_threshold(self):
+        # Each sink deletes a different key: 1/3 of items each, 2/3 overall.
+        prompts = []
+
+        class Decider(interaction.ThresholdDecider):
+            def choose_mode(self, context, mode):
+                prompts.append(dict(context.stats))
+                return super().choose_mode(context, mode)
+
+        repl = factories.PipelinedReplicatorFactory(
+            source__data={'a': 1, 'b': 2, 'c': 3, 'd': 4},
+            sink0__initial={'a': 1, 'b': 2, 'c': 3, 'x': 0},
+            sink1__initial={'a': 1, 'b': 2, 'c': 3, 'y': 0},
+            interactor__decider=Decider(deleted_ratio=0.4),
+        )
+        context = repl.replicate(datastructs.ReplicationMode.FULL)
+        sink0, sink1 = repl.sinks
+        # Downgraded to ADDITIVE: creations still happen, deletions don't.
+        self.assertEqual([], sink0.deleted)
+        self.assertEqual([], sink1.deleted)
+        self.assertEqual({'d': 4}, sink0.created)
+        self.assertEqual({'d': 4}, sink1.created)
+        self.assertEqual(2, context.stats[datastructs.Action.DELETED])
+        # A single decision, over all sinks.
+        self.assertEqual(1, len(prompts))
+        self.assertEqual(2, prompts[0][datastructs.Action.DELETED])
+
+    def test_unbounded_decider(self):
+        class SlowSink(factories.DictSink):
+            def all(self):
+                time.sleep(0.05)
+                return super().all()
+
+        fast = factories.DictSinkFactory()
+        repl = factories.PipelinedReplicatorFactory(
+            source__data={'a': 1},
+            sink0=fast,
+            sink1=SlowSink(initial={}, name='slow'),
+            interactor__decider=factories.ShellDeciderFactory(stdin=['0']),
+        )
+        repl.replicate(datastructs.ReplicationMode.FULL)
+        # The operator chose DRY_RUN: nothing may have been written meanwhile.
+        self.assertEqual({}, fast.created)
+        for sink in repl.sinks:
+            self.assertEqual([], sink.journal)
+
+    def test_additive_waits_for_decision(self):
+        repl = factories.PipelinedReplicatorFactory(
+            source__data={'a': 1, 'b': 2},
+            sink0__initial={'a': 1},
+            interactor__decider=factories.ThresholDeciderFactory(created_ratio=0.1),
+        )
+        repl.replicate(datastructs.ReplicationMode.ADDITIVE)
+        sink0, sink1 = repl.sinks
+        self.assertEqual({}, sink0.created)
+        self.assertEqual({}, sink1.created)
+
+    def test_verify(self):
+        sink0 = factories.LossyDictSinkFactory(lost=['a'])
+        repl = factories.PipelinedReplicatorFactory(
+            source__data={'a': 1, 'b': 2},
+            sink0=sink0,
+            verifier=factories.SampledVerifierFactory(),
+        )
+        context = repl.replicate(datastructs.ReplicationMode.ADDITIVE)
+        self.assertEqual(['a'], list(context.divergences[sink0][datastructs.Action.CREATED]))
+
+
+class RecordTest(unittest.TestCase):
+    def test_freeze(self):
+        record = records.Record({'name': 'alice', 'groups': ['a', 'b'], 'tags': {'x'}, 'extra': {'k': [1]}})
+        self.assertEqual(('a', 'b'), record['groups'])
+        self.assertEqual(frozenset({'x'}), record['tags'])
+        self.assertIsInstance(record['extra'], records.Record)
+        self.assertEqual({'name': 'alice', 'groups': ['a', 'b'], 'tags': {'x'}, 'extra': {'k': [1]}}, record.thaw())
+        with self.assertRaises(TypeError):
+            record['name'] = 'bob'
+        self.assertEqual(hash(record), hash(records.Record(record.thaw())))
+
+    def test_intern(self):
+        first = records.intern({'name': 'alice', 'groups': ['a']})
+        second = records.intern({'groups': ['a'], 'name': 'alice'})
+        self.assertIs(first, second)
+        self.assertIsNot(first, records.intern({'name': 'bob', 'groups': ['a']}))
+
+    def test_evolve(self):
+        photo = b'\x00' * 1024
+        record = records.Record(name='alice', photo=photo, groups=['a'])
+        renamed = record.evolve(name='bob')
+        self.assertEqual('bob', renamed['name'])
+        self.assertEqual('alice', record['name'])
+        self.assertIs(record['photo'], renamed['photo'])
+        self.assertIs(record['groups'], renamed['groups'])
+        self.assertEqual({'name': 'alice', 'groups': ('a',)}, dict(record.without('photo')))
+
+    def test_projection(self):
+        calls = []
+
+        def project(record):
+            calls.append(record)
+            return {'login': record['name'].upper()}
+
+        record = records.Record(name='alice')
+        self.assertEqual({'login': 'ALICE'}, record.project('sink', project))
+        self.assertIs(record.project('sink', project), record.project('sink', project))
+        self.assertEqual(1, len(calls))
+
+    def test_shared_between_sinks(self):
+        source = records.RecordSource(factories.DictSource({'a': {'name': 'alice'}}))
+        repl = factories.ReplicatorFactory(source=source)
+        context = repl.replicate(datastructs.ReplicationMode.FULL)
+        sink0, sink1 = repl.sinks
+        self.assertIs(sink0.created['a'], sink1.created['a'])
+        self.assertIsInstance(sink0.created['a'], records.Record)
+        self.assertEqual({'a'}, context.keys)
+
+    def test_plain_equality(self):
+        record = records.Record(name='a', groups=['x'], extra={'tags': {'t'}})
+        plain = {'name': 'a', 'groups': ['x'], 'extra': {'tags': {'t'}}}
+        self.assertEqual(plain, record)
+        self.assertEqual(record, plain)
+        self.assertFalse(record != plain)
+        self.assertNotEqual(record, dict(plain, groups=['y']))
+        self.assertNotEqual(record, dict(plain, extra={'tags': {'u'}}))
+        self.assertNotEqual(record, {'name': 'a', 'groups': ['x'], 'other': None})
+        self.assertNotEqual(record, ['a'])
+
+    def test_unchanged_through_record_source(self):
+        item = {'name': 'alice', 'groups': ['x', 'y']}
+        repl = factories.ReplicatorFactory(
+            source=records.RecordSource(factories.DictSource({'a': item})),
+            sink0__initial={'a': {'name': 'alice', 'groups': ['x', 'y']}},
+            sink1__initial={'a': {'name': 'alice', 'groups': ['x']}},
+        )
+        context = repl.replicate(datastructs.ReplicationMode.FULL)
+        sink0, sink1 = repl.sinks
+        self.assertEqual(['a'], list(context.changes[sink0][datastructs.Action.UNCHANGED]))
+        self.assertEqual({}, sink0.updated)
+        self.assertEqual(['a'], list(sink1.updated))
+
+
+class AttributeMappingTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.mapping = mapping.AttributeMapping([
+            mapping.Copy('email'),
+            mapping.Rename('uid', 'login'),
+            mapping.Transform('cn', str.title, target='display_name'),
+            mapping.AsSet('groups'),
+            mapping.Ignore('photo'),
+        ])
+
+    def test_unchanged(self):
+        self.assertIsNone(self.mapping.merge(
+            {'email': 'a@x', 'login': 'alice', 'display_name': 'Alice A', 'groups': ['b', 'a'], 'id': 42},
+            {'email': 'a@x', 'uid': 'alice', 'cn': 'alice a', 'groups': ['a', 'b'], 'photo': b'...'},
+        ))
+
+    def test_changed(self):
+        delta = self.mapping.merge(
+            {'email': 'a@x', 'login': 'alice', 'display_name': 'Alice', 'groups': ['a']},
+            {'email': 'a@x', 'uid': 'alice2', 'cn': 'alice', 'groups': ['a', 'b']},
+        )
+        self.assertEqual(
+            [
+                mapping.AttributeDelta('login', 'alice', 'alice2'),
+                mapping.AttributeDelta('groups', ['a'], ['a', 'b']),
+            ],
+            list(delta),
+        )
+        self.assertEqual({'login': 'alice2', 'groups': ['a', 'b']}, delta.as_dict())
+        self.assertEqual("login: 'alice' -> 'alice2', groups: ['a'] -> ['a', 'b']", str(delta))
+
+    def test_creation(self):
+        delta = self.mapping.merge(None, {'uid': 'alice', 'cn': 'alice'})
+        self.assertEqual(
+            {'login': 'alice', 'display_name': 'Alice'},
+            delta.as_dict(),
+        )
+
+    def test_copy_others(self):
+        rules = mapping.AttributeMapping([mapping.Rename('uid', 'login'), mapping.Ignore('photo')], copy_others=True)
+        self.assertEqual(
+            [mapping.AttributeDelta('shell', None, '/bin/sh')],
+            list(rules.merge({'login': 'a', 'id': 1}, {'uid': 'a', 'shell': '/bin/sh', 'photo': b''})),
+        )
+        self.assertEqual(
+            {'login': 'a', 'shell': '/bin/sh'},
+            rules.project({'uid': 'a', 'shell': '/bin/sh', 'photo': b''}),
+        )
+
+    def test_duplicate_targets(self):
+        with self.assertRaises(ValueError):
+            mapping.AttributeMapping([mapping.Rename('uid', 'login'), mapping.Copy('login')])
+
+    def test_sink_merge(self):
+        class MappedSink(factories.DictSink):
+            attribute_mapping = self.mapping
+            merge = base.DataSink.merge
+
+        sink0 = MappedSink(
+            initial={'a': {'login': 'alice', 'display_name': 'Alice'}, 'b': {'login': 'bob'}},
+            name='mapped',
+        )
+        repl = factories.ReplicatorFactory(
+            source__data={'a': {'uid': 'alice', 'cn': 'alice'}, 'b': {'uid': 'bobby'}},
+            sink0=sink0,
+        )
+        repl.replicate(datastructs.ReplicationMode.FULL)
+        self.assertEqual(['b'], list(sink0.updated))
+
+    def test_mapping_with_record(self):
+        rules = mapping.AttributeMapping([mapping.Copy('groups', 'name')], copy_others=True)
+        record = records.Record(name='alice', groups=['x'], tags=['t'])
+        self.assertIsNone(rules.merge({'name': 'alice', 'groups': ['x'], 'tags': ['t']}, record))
+        self.assertEqual(
+            [mapping.AttributeDelta('groups', ['y'], ('x',))],
+            list(rules.merge({'name': 'alice', 'groups': ['y'], 'tags': ['t']}, record)),
+        )
+
+
+class AdaptiveExecutorTest(unittest.TestCase):
+    def test_controller(self):
+        controller = execution.AIMDController(
+            batch_size=10, batch_step=5, max_batch_size=20, concurrency=2, max_concurrency=3,
+            target_latency=0.1,
+        )
+        decision = controller.record([0.01, 0.05], errors=0)
+        self.assertEqual((15, 3), (decision.batch_size, decision.concurrency))
+        decision = controller.record([0.01], errors=0)
+        self.assertEqual((20, 3), (decision.batch_size, decision.concurrency))
+        # Capped: nothing changes.
+        self.assertIsNone(controller.record([0.01], errors=0))
+        decision = controller.record([0.01, 0.5], errors=0)
+        self.assertEqual((10, 1), (decision.batch_size, decision.concurrency))
+        self.assertIn("above", decision.reason)
+        decision = controller.record([0.01], errors=1)
+        self.assertEqual((5, 1), (decision.batch_size, decision.concurrency))
+
+    def test_grow(self):
+        journal = []
+        executor = execution.AdaptiveExecutor(batch_size=2, batch_step=2, max_concurrency=4)
+        repl = factories.ReplicatorFactory(
+            source__data={'k%03d' % i: i for i in range(100)},
+            sink0__journal=journal,
+            sink1__journal=journal,
+            executor=executor,
+        )
+        repl.replicate(datastructs.ReplicationMode.FULL)
+        for sink in repl.sinks:
+            self.assertEqual({'k%03d' % i: i for i in range(100)}, sink.created)
+            controller = executor.controllers[sink]
+            self.assertEqual(4, controller.concurrency)
+            self.assertGreater(controller.batch_size, 2)
+        self.assertEqual([2, 4, 4, 6, 6, 6], [len(keys) for _name, _action, keys in journal[:6]])
+
+    def test_errors(self):
+        decisions = []
+
+        class Interactor(interaction.BaseInteractor):
+            def notify_tuning(self, sink, action, decision):
+                decisions.append(decision)
+
+        sink0 = factories.RejectingDictSinkFactory(rejected=['k005'])
+        executor = execution.AdaptiveExecutor(
+            fallback=execution.BisectingExecutor(),
+            batch_size=4,
+            concurrency=2,
+        )
+        repl = factories.ReplicatorFactory(
+            source__data={'k%03d' % i: i for i in range(20)},
+            sink0=sink0,
+            executor=executor,
+            interactor=Interactor(),
+        )
+        context = repl.replicate(datastructs.ReplicationMode.FULL)
+        self.assertEqual(['k005'], list(context.failures[sink0][datastructs.Action.CREATED]))
+        self.assertEqual(19, len(sink0.created))
+        # Keys are processed in arbitrary order: the failing round may come later.
+        failed = [index for index, decision in enumerate(decisions) if decision.errors]
+        self.assertEqual(1, len(failed))
+        before = decisions[failed[0] - 1] if failed[0] else execution.TuningDecision(4, 2, 0, 0, '')
+        self.assertEqual(
+            (before.batch_size // 2, max(1, before.concurrency // 2)),
+            (decisions[failed[0]].batch_size, decisions[failed[0]].concurrency),
+        )
+
+
+class MultiTenantTest(unittest.TestCase):
+    def test_shared_snapshot(self):
+        class CountingSource(factories.DictSource):
+            fetches = 0
+
+            def all(self):
+                self.fetches += 1
+                return super().all()
+
+        source = CountingSource({'a': 1, 'b': 2})
+        strict = datastructs.Tenant(
+            name='strict',
+            sinks=[factories.DictSinkFactory(initial={'a': 1})],
+            interactor=factories.InteractorFactory(
+                decider=factories.ThresholDeciderFactory(created_ratio=0.1),
+            ),
+        )
+        lenient = datastructs.Tenant(
+            name='lenient',
+            sinks=[factories.DictSinkFactory(), factories.DictSinkFactory(initial={'c': 3})],
+            interactor=factories.InteractorFactory(),
+        )
+        runner = tenants.MultiTenantRunner(source, [strict, lenient], workers=2)
+        results = runner.replicate(datastructs.ReplicationMode.ADDITIVE)
+
+        self.assertEqual(1, source.fetches)
+        self.assertEqual(['strict', 'lenient'], list(results))
+        # The strict tenant's threshold was broken: dry run.
+        self.assertEqual({}, strict.sinks[0].created)
+        for sink in lenient.sinks:
+            self.assertEqual({'a': 1, 'b': 2}, sink.created)
+            self.assertEqual([], sink.deleted)
+        self.assertIsNone(results['lenient'].error)
+        self.assertIs(results['strict'].context.keys, results['lenient'].context.keys)
+
+    def test_failing_tenant(self):
+        broken = datastructs.Tenant(
+            name='broken',
+            sinks=[factories.RejectingDictSinkFactory(rejected=['a'])],
+            interactor=factories.InteractorFactory(),
+        )
+        sound = datastructs.Tenant(
+            name='sound',
+            sinks=[factories.DictSinkFactory()],
+            interactor=factories.InteractorFactory(),
+        )
+        runner = tenants.MultiTenantRunner(factories.DictSource({'a': 1}), [broken, sound], workers=1)
+        results = runner.replicate(datastructs.ReplicationMode.FULL)
+        self.assertIsInstance(results['broken'].error, ValueError)
+        self.assertIsNone(results['broken'].context)
+        self.assertEqual({'a': 1}, sound.sinks[0].created)
+
+    def test_shared_profiler(self):
+        class SlowSink(factories.DictSink):
+            def create_batch(self, changes):
+                time.sleep(0.05)
+                super().create_batch(changes)
+
+        class CountingProfiler(profiling.SamplingProfiler):
+            writes = 0
+
+            def write(self):
+                self.writes += 1
+                return super().write()
+
+        tenant_list = [
+            datastructs.Tenant(
+                name=name,
+                sinks=[SlowSink(initial={}, name='slow')],
+                interactor=factories.InteractorFactory(),
+            )
+            for name in ['alpha', 'beta']
+        ]
+        with tempfile.TemporaryDirectory() as output_dir:
+            profiler = CountingProfiler(output_dir, interval=0.001)
+            runner = tenants.MultiTenantRunner(
+                factories.DictSource({'a': 1}), tenant_list, workers=2, profiler=profiler,
+            )
+            runner.replicate(datastructs.ReplicationMode.FULL)
+
+            with open(os.path.join(output_dir, profiling.COLLAPSED_FILENAME)) as f:
+                stacks = [line.rsplit(' ', 1)[0] for line in f]
+
+        self.assertEqual(1, profiler.writes)
+        for name in ['alpha', 'beta']:
+            self.assertTrue(any(s.startswith('%s;replicate;<SlowSink: slow>;CREATED;' % name) for s in stacks))